@@ -0,0 +1,62 @@
+"""
+Import-time benchmark for MorphoUnit.
+
+Each statement is run in a fresh Python interpreter (as short-lived worker processes do),
+and the median wall time over several runs is reported, together with the heavy
+third-party packages that ended up imported.
+
+Usage:
+    python benchmarks/import_time.py [--runs N] [statement ...]
+"""
+
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+STATEMENTS = [
+    "import morphounit.tests.morph_circuits",
+    "from morphounit.tests.morph_circuits import CellDensityTest",
+    "from morphounit.tests.morph_cells import NeuroM_MorphStats_Test",
+    "import morphounit.scores as mph_scores; mph_scores.CombineZScores",
+    "import morphounit.plots as mph_plots; mph_plots.jsonFile_MorphStats",
+    "import morphounit.plots as mph_plots; mph_plots.FeatsPop_MorphStats",
+]
+
+HEAVY_PACKAGES = ["sciunit", "neurom", "matplotlib", "seaborn", "pandas", "scipy"]
+
+TIMER = """
+import sys, time, json
+t0 = time.perf_counter()
+exec(sys.argv[1])
+elapsed = time.perf_counter() - t0
+print(json.dumps({"time": elapsed, "loaded": [pkg for pkg in sys.argv[2:] if pkg in sys.modules]}))
+"""
+
+
+def time_statement(statement, runs):
+    times = list()
+    loaded = list()
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", TIMER, statement] + HEAVY_PACKAGES,
+                                check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+        result = json.loads(output.splitlines()[-1])
+        times.append(result["time"])
+        loaded = result["loaded"]
+    return statistics.median(times), loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("statements", nargs="*", default=STATEMENTS, help="Python statements to time")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per statement")
+    args = parser.parse_args()
+
+    for statement in args.statements:
+        median_time, loaded = time_statement(statement, args.runs)
+        print("%8.1f ms  %-70s [%s]" % (1e3 * median_time, statement, ", ".join(loaded)))
+
+
+if __name__ == "__main__":
+    main()
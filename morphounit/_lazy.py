@@ -0,0 +1,63 @@
+"""Lazy loading of the plugin modules of MorphoUnit's subpackages (tests, scores, plots, capabilities)"""
+
+import ast
+import sys
+import glob
+import importlib
+from os.path import dirname, basename, isfile
+
+
+def public_names(file_path):
+    """Names that 'from module import *' would bring from the module's own top-level definitions
+    (classes, functions and variables not starting with '_', or those listed in '__all__'),
+    found by parsing its source file, i.e. without importing it"""
+
+    with open(file_path, 'rb') as fp:
+        tree = ast.parse(fp.read(), filename=file_path)
+
+    names = list()
+    for node in tree.body:
+        if isinstance(node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+            names.append(node.name)
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            for target in targets:
+                if isinstance(target, ast.Name):
+                    if target.id == '__all__':
+                        return list(ast.literal_eval(node.value))
+                    names.append(target.id)
+    return [name for name in names if not name.startswith('_')]
+
+
+def plugin_loader(package_name, package_file, prefix):
+    """
+    Sets up the lazy loading of the plugin modules of a package: files in the package's directory
+    with the given prefix and extension ".py". Their public names are exposed as attributes
+    of the package, but each module is only imported on first access to any of them.
+
+    Returns the list of plugin modules, the list of public names ('__all__') and the
+    '__getattr__' and '__dir__' functions for the package (PEP 562).
+    """
+
+    files = sorted(f for f in glob.glob(dirname(package_file) + "/" + prefix + "*.py") if isfile(f))
+    modules = [basename(f)[:-3] for f in files]
+
+    # Public name -> plugin module defining it (as with successive star imports, the last one wins)
+    name_modules = dict()
+    for module, file_path in zip(modules, files):
+        for name in public_names(file_path):
+            name_modules[name] = module
+
+    def __getattr__(name):
+        if name in modules:
+            return importlib.import_module("." + name, package_name)
+        if name not in name_modules:
+            raise AttributeError(f"module {package_name!r} has no attribute {name!r}")
+        value = getattr(importlib.import_module("." + name_modules[name], package_name), name)
+        setattr(sys.modules[package_name], name, value)  # Next accesses no longer go through __getattr__
+        return value
+
+    def __dir__():
+        return sorted(set(vars(sys.modules[package_name])) | set(modules) | set(name_modules))
+
+    return modules, sorted(name_modules), __getattr__, __dir__
@@ -0,0 +1,261 @@
+"""Output directories and files (artifacts) of MorphoUnit's tests and models, safe for concurrent runs"""
+
+import os
+import types
+import pickle
+import binascii
+import contextlib
+from datetime import datetime
+from collections.abc import Sequence
+from concurrent.futures import Future, ProcessPoolExecutor
+
+def run_dir_name():
+    """Name for the output directory of a run: a timestamp, followed by the process ID
+    and a random suffix, so that runs started at the same time do not collide"""
+
+    return "%s-%d-%s" % (datetime.now().strftime("%Y%m%d-%H%M%S"), os.getpid(),
+                         binascii.hexlify(os.urandom(3)).decode())
+
+
+def unique_run_dir(*path_parts):
+    """Creates a new, unique run directory inside 'os.path.join(*path_parts)' and returns its path"""
+
+    while True:
+        run_dir = os.path.join(*path_parts, run_dir_name())
+        try:
+            os.makedirs(run_dir)
+            return run_dir
+        except FileExistsError:
+            continue
+
+
+@contextlib.contextmanager
+def atomic_path(filepath):
+    """Yields a temporary path next to 'filepath', to write the file to; once done,
+    the file is renamed to 'filepath', so that readers never see partial contents.
+    The temporary file keeps the extension of 'filepath' (e.g. for matplotlib to infer the format)"""
+
+    file_dir = os.path.dirname(filepath) or '.'
+    if not os.path.exists(file_dir):
+        os.makedirs(file_dir, exist_ok=True)
+
+    # Created as open() would do, with the process umask applied to 0o666
+    # (tempfile.mkstemp would create it readable by its owner only)
+    while True:
+        tmp_path = os.path.join(file_dir, '.tmp-' + binascii.hexlify(os.urandom(6)).decode() +
+                                os.path.splitext(filepath)[1])
+        try:
+            os.close(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666))
+            break
+        except FileExistsError:
+            continue
+    try:
+        yield tmp_path
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+@contextlib.contextmanager
+def atomic_open(filepath, mode='w', **kwargs):
+    """Same as 'open(filepath, mode)', for writing, but the file only appears (complete) once closed"""
+
+    with atomic_path(filepath) as tmp_path:
+        with open(tmp_path, mode, **kwargs) as fp:
+            yield fp
+
+
+def atomic_savefig(figure, filepath, **kwargs):
+    """Saves a matplotlib figure to 'filepath' atomically"""
+
+    with atomic_path(filepath) as tmp_path:
+        figure.savefig(tmp_path, **kwargs)
+
+
+@contextlib.contextmanager
+def new_figure(**kwargs):
+    """Yields a new matplotlib Figure ('kwargs' as for matplotlib.figure.Figure), not managed by pyplot:
+    no global state is involved in drawing it (so it can be drawn in threads or worker processes),
+    and nothing keeps it alive once done. Its artists are released on exit, even on errors"""
+
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    figure = Figure(**kwargs)
+    FigureCanvasAgg(figure)  # Figures only get a canvas by default from matplotlib 3.1 on
+    try:
+        yield figure
+    finally:
+        figure.clear()
+
+
+# ----------------------------------------------------------------------
+
+# Artifact policies of the tests: no artifacts, only data summaries (JSON files and text tables),
+# or also figures
+ARTIFACT_POLICIES = ('none', 'summary', 'full')
+
+# Test attributes read by the plot classes in morphounit.plots
+SNAPSHOT_ATTRIBUTES = ('name', 'model_name', 'path_test_output', 'observation', 'prediction', 'score',
+                       'score_dict', 'score_cell_dict', 'score_feat_dict', 'prediction_matrix', 'score_matrix',
+                       'prediction_cells_matrix')
+
+
+def check_artifact_policy(artifact_policy):
+    if artifact_policy not in ARTIFACT_POLICIES:
+        raise ValueError("Artifact policy must be one of %s, not %r" % (ARTIFACT_POLICIES, artifact_policy))
+    return artifact_policy
+
+
+def artifact_context(testObj):
+    """Snapshot of the Test's attributes used to create its artifacts, so that these can be rendered
+    later on (even if the Test judges other models meanwhile)"""
+
+    return types.SimpleNamespace(**{attr: getattr(testObj, attr) for attr in SNAPSHOT_ATTRIBUTES
+                                    if hasattr(testObj, attr)})
+
+
+def render_plot(plot_class_name, **kwargs):
+    """Creates the files of one of the classes in morphounit.plots (whose module is imported on demand),
+    returning the list of file paths"""
+
+    import morphounit.plots as plots
+    return getattr(plots, plot_class_name)(**kwargs).create()
+
+
+class LazyArtifacts(Sequence):
+    """
+    Sequence of the artifact files of a Test, e.g. score.related_data["figures"].
+    Rendering jobs can be deferred: they only run when the files are accessed
+    (iterating, indexing or taking the length of the sequence) or exported.
+    """
+
+    def __init__(self, paths=(), writer=None):
+        self._paths = list(paths)
+        self._pending = list()
+        self.writer = writer
+
+    def defer(self, render, *args, **kwargs):
+        """Adds a rendering job: 'render(*args, **kwargs)' must return the path, or list of paths, created.
+        With an ArtifactWriter, the job is submitted to its worker processes right away
+        (so 'render' and its arguments must be picklable)"""
+
+        if self.writer is not None:
+            self._pending.append(self.writer.submit(render, *args, **kwargs))
+        else:
+            self._pending.append((render, args, kwargs))
+
+    def append(self, path):
+        self._paths.append(path)
+
+    def extend(self, paths):
+        self._paths.extend(paths)
+
+    @property
+    def pending(self):
+        """Number of rendering jobs not run yet"""
+        return len(self._pending)
+
+    def export(self):
+        """Runs the pending rendering jobs, and returns the list of all artifact files.
+        A job is only dropped once it succeeds: if it fails, its error is raised
+        (again, on every later access) instead of leaving the list silently incomplete"""
+
+        while self._pending:
+            job = self._pending[0]
+            if isinstance(job, Future):
+                paths = job.result()
+            else:
+                render, args, kwargs = job
+                paths = render(*args, **kwargs)
+            self._pending.pop(0)
+            if isinstance(paths, str):
+                self._paths.append(paths)
+            else:
+                self._paths.extend(paths)
+        return list(self._paths)
+
+    def __getitem__(self, index):
+        return self.export()[index]
+
+    def __len__(self):
+        return len(self.export())
+
+    def __repr__(self):
+        return "%s(%r, pending=%d)" % (type(self).__name__, self._paths, len(self._pending))
+
+
+def _run_pickled(job):
+    render, args, kwargs = pickle.loads(job)
+    return render(*args, **kwargs)
+
+
+class ArtifactWriter:
+    """
+    Bounded pool of worker processes (matplotlib is not thread-safe) rendering the artifacts of tests
+    in the background, so that scores are returned right away, e.g.:
+
+        writer = ArtifactWriter(max_workers=2)
+        test = NeuroM_MorphStats_Test(observation, artifact_writer=writer)
+        scores = [test.judge(model) for model in models]
+        writer.flush()   # waits for all files to land
+        writer.close()
+    """
+
+    def __init__(self, max_workers=None, mp_context=None):
+        self.max_workers = max_workers
+        self.mp_context = mp_context
+        self._executor = None
+        self._futures = list()
+
+    def submit(self, render, *args, **kwargs):
+        """Submits the rendering job 'render(*args, **kwargs)', returning its Future.
+        The job is pickled right away: later changes to its arguments (e.g. the score,
+        once bound to the model and test by sciunit) do not reach the worker"""
+
+        job = pickle.dumps((render, args, kwargs))
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=self.mp_context)
+        future = self._executor.submit(_run_pickled, job)
+        self._futures.append(future)
+        return future
+
+    def flush(self):
+        """Waits for all jobs submitted so far; returns the list of files created,
+        or raises the exception of the first job that failed"""
+
+        futures, self._futures = self._futures, list()
+        paths = list()
+        for future in futures:
+            result = future.result()
+            if isinstance(result, str):
+                paths.append(result)
+            else:
+                paths.extend(result)
+        return paths
+
+    join = flush
+
+    def close(self, wait=True):
+        """Shuts the worker processes down (after waiting for the jobs, unless 'wait' is False)"""
+
+        if self._executor is not None:
+            if not wait:
+                # Jobs not started yet are dropped (as 'cancel_futures' does, on Python >= 3.9 only)
+                for future in self._futures:
+                    future.cancel()
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+        self._futures = list()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.flush()
+        finally:
+            self.close(wait=exc_type is None)
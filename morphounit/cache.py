@@ -0,0 +1,189 @@
+import os
+import json
+import hashlib
+
+from morphounit.artifacts import atomic_open
+
+
+def file_digest(file_path):
+    """Returns the SHA-256 digest of the file contents"""
+
+    file_hash = hashlib.sha256()
+    with open(file_path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(2**20), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+class FeatureCache:
+    """
+    On-disk cache of per-cell feature results, addressed by content:
+    entries are keyed by a hash of the morphology file contents together with
+    whatever else determines the result (configuration, NeuroM's version, ...).
+    The total size of the cache is bounded; least recently used entries are evicted first.
+    """
+
+    def __init__(self, cache_dir, max_size=2**30):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+        self._file_digests = dict()  # (path, size, mtime) -> contents' digest, for this process
+        self._size = None  # Total size of the entries, computed on first insertion
+
+    def file_digest(self, file_path):
+        """Returns the SHA-256 digest of the file contents. Files are read only once per
+        process, unless their size or modification time changes"""
+
+        stat = os.stat(file_path)
+        stat_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+        if stat_key not in self._file_digests:
+            self._file_digests[stat_key] = file_digest(file_path)
+        return self._file_digests[stat_key]
+
+    def key(self, file_path, *parts):
+        """Builds the cache key for a file, given the other (JSON-serializable) parts
+        the cached result depends on"""
+
+        key_hash = hashlib.sha256(self.file_digest(file_path).encode())
+        for part in parts:
+            key_hash.update(json.dumps(part, sort_keys=True).encode())
+        return key_hash.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.json')
+
+    def get(self, key):
+        """Returns the cached value for 'key', or None if missing"""
+
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, 'r') as fp:
+                value = json.load(fp)
+        except (IOError, ValueError):
+            return None
+        # Marking the entry as recently used
+        try:
+            os.utime(entry_path)
+        except OSError:
+            pass
+        return value
+
+    def put(self, key, value):
+        """Stores a (JSON-serializable) value for 'key', evicting old entries if needed"""
+
+        entry_path = self._entry_path(key)
+        try:
+            old_size = os.path.getsize(entry_path)  # Entry replaced, if any
+        except OSError:
+            old_size = 0
+
+        with atomic_open(entry_path, 'w') as fp:
+            json.dump(value, fp)
+
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+        else:
+            self._size += os.path.getsize(entry_path) - old_size
+        if self._size > self.max_size:
+            self.evict()
+
+    def _entries(self):
+        for dir_path, _, file_names in os.walk(self.cache_dir):
+            for file_name in file_names:
+                # Skipping the temporary files of entries being written
+                if file_name.endswith('.json') and not file_name.startswith('.tmp-'):
+                    entry_path = os.path.join(dir_path, file_name)
+                    try:
+                        stat = os.stat(entry_path)
+                    except OSError:
+                        continue
+                    yield entry_path, stat.st_size, stat.st_mtime
+
+    def evict(self):
+        """Removes the least recently used entries, until the cache fits
+        within 90% of its maximum size"""
+
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        self._size = sum(size for _, size, _ in entries)
+        for entry_path, size, _ in entries:
+            if self._size <= 0.9 * self.max_size:
+                break
+            try:
+                os.remove(entry_path)
+            except OSError:
+                continue
+            self._size -= size
+
+    def clear(self):
+        """Removes all entries"""
+
+        for entry_path, _, _ in list(self._entries()):
+            os.remove(entry_path)
+        self._size = 0
+
+
+class FileManifest:
+    """
+    Manifest of the morphology files processed in a previous run: size, modification time
+    and contents' hash of each file, together with the per-cell results of each processing step.
+    Results of a file are reused as long as its contents are unchanged (files whose size and
+    modification time are unchanged are not even read). Files no longer present are dropped.
+    """
+
+    def __init__(self, manifest_path):
+        self.manifest_path = manifest_path
+        try:
+            with open(self.manifest_path, 'r') as fp:
+                self._entries = json.load(fp)["files"]
+        except (IOError, ValueError, KeyError, TypeError):
+            self._entries = dict()
+
+    @staticmethod
+    def step_key(*parts):
+        """Builds the key identifying the (JSON-serializable) inputs of a processing step,
+        other than the file itself"""
+
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+    def _current_entry(self, file_path):
+        """Returns the manifest entry of the file, after checking it is still up to date:
+        when the file contents have changed, its previous results are discarded"""
+
+        abs_path = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        entry = self._entries.get(abs_path)
+        if entry is not None and (entry["size"], entry["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+            return entry
+
+        digest = file_digest(file_path)
+        if entry is None or entry["sha256"] != digest:
+            entry = {"sha256": digest, "results": dict()}
+            self._entries[abs_path] = entry
+        entry.update({"size": stat.st_size, "mtime_ns": stat.st_mtime_ns})
+        return entry
+
+    def get(self, file_path, step_name, step_key):
+        """Returns the result of the step 'step_name' stored for the file,
+        or None if the file was added or changed, or the step's inputs differ"""
+
+        result = self._current_entry(file_path)["results"].get(step_name)
+        if result is None or result["key"] != step_key:
+            return None
+        return result["value"]
+
+    def put(self, file_path, step_name, step_key, value):
+        """Stores the (JSON-serializable) result of the step 'step_name' for the file,
+        replacing any result of that step obtained with different inputs"""
+
+        self._current_entry(file_path)["results"][step_name] = {"key": step_key, "value": value}
+
+    def save(self):
+        """Writes the manifest to disk, dropping the files that no longer exist"""
+
+        for abs_path in [abs_path for abs_path in self._entries if not os.path.isfile(abs_path)]:
+            del self._entries[abs_path]
+
+        with atomic_open(self.manifest_path, 'w') as fp:
+            json.dump({"files": self._entries}, fp)
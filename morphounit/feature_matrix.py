@@ -0,0 +1,215 @@
+import numpy as np
+
+
+class FeatureMatrix:
+    """
+    Columnar container for the morpho-features of a set of cells:
+    a float64 (cells x features) matrix, together with the array of cell IDs (rows)
+    and the arrays of cell parts and feature names (columns).
+    Missing values are stored as NaN.
+
+    The nested-dictionary forms used elsewhere, i.e.
+    {cell_ID: {cell_part: {feat_name: X}}} and {cell_part: {feat_name: [X_cell1, X_cell2, ...]}},
+    are available as views (see 'to_dict' and 'to_columns').
+    """
+
+    def __init__(self, values, cell_ids, cell_parts, feat_names, name=None):
+        self.name = name  # Optional label for the set of cells, e.g. the population's name
+        self.values = np.asarray(values, dtype=np.float64).reshape(len(cell_ids), len(feat_names))
+        self.cell_ids = np.asarray(cell_ids, dtype=object)
+        self.cell_parts = np.asarray(cell_parts, dtype=object)
+        self.feat_names = np.asarray(feat_names, dtype=object)
+        self._columns = {feature: j for j, feature in enumerate(zip(self.cell_parts, self.feat_names))}
+
+    @classmethod
+    def from_cells(cls, cells, features=None):
+        """Builds the matrix from an iterable of (cell_ID, cell_dict) pairs, where
+        cell_dict = {cell_part: {feat_name: X}}. Columns follow 'features', a list of
+        (cell_part, feat_name) pairs, if given; otherwise, the order in which features are found"""
+
+        builder = FeatureMatrixBuilder(features)
+        for cell_ID, cell_dict in cells:
+            builder.add(cell_ID, cell_dict)
+        return builder.build()
+
+    @classmethod
+    def from_dict(cls, cells_dict, features=None):
+        """Builds the matrix from a dictionary {cell_ID: {cell_part: {feat_name: X}}}"""
+
+        return cls.from_cells(cells_dict.items(), features=features)
+
+    # ----------------------------------------------------------------------
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    @property
+    def features(self):
+        """List of (cell_part, feat_name) pairs, in column order"""
+        return list(self._columns)
+
+    def column_index(self, cell_part, feat_name):
+        return self._columns[(cell_part, feat_name)]
+
+    def column(self, cell_part, feat_name):
+        """Values of a feature for all cells (a view, not a copy)"""
+        return self.values[:, self._columns[(cell_part, feat_name)]]
+
+    def part_columns(self, cell_part):
+        """Column indexes of the features of a cell part: a slice when they are contiguous,
+        so that indexing the matrix with it gives a view"""
+
+        columns = np.flatnonzero(self.cell_parts == cell_part)
+        if len(columns) and columns[-1] - columns[0] == len(columns) - 1:
+            return slice(columns[0], columns[-1] + 1)
+        return columns
+
+    def cell_part_names(self):
+        """Cell parts, in column order"""
+        return list(dict.fromkeys(self.cell_parts))
+
+    def frame(self, cell_part):
+        """pandas DataFrame (cells x features) with the features of a cell part"""
+
+        import pandas as pd
+
+        columns = self.part_columns(cell_part)
+        return pd.DataFrame(self.values[:, columns], index=list(self.cell_ids),
+                            columns=list(self.feat_names[columns]))
+
+    # ----------------------------------------------------------------------
+
+    def to_dict(self):
+        """Returns {cell_ID: {cell_part: {feat_name: X}}}, omitting missing values"""
+
+        cells_dict = dict()
+        for cell_ID, row in zip(self.cell_ids, self.values.tolist()):
+            cell_dict = cells_dict.setdefault(cell_ID, dict())
+            for cell_part, feat_name, value in zip(self.cell_parts, self.feat_names, row):
+                if value == value:  # not NaN
+                    cell_dict.setdefault(cell_part, dict())[feat_name] = value
+        return cells_dict
+
+    def to_columns(self):
+        """Returns {cell_part: {feat_name: [X_cell1, X_cell2, ...]}}"""
+
+        columns_dict = dict()
+        for cell_part, feat_name, values in zip(self.cell_parts, self.feat_names, self.values.T.tolist()):
+            columns_dict.setdefault(cell_part, dict())[feat_name] = values
+        return columns_dict
+
+
+class FeatureMatrixBuilder:
+    """
+    Builds a FeatureMatrix one cell at a time. Columns are added as new features are found
+    (cells lacking them get NaN); rows are kept as float64 arrays until the matrix is built.
+    """
+
+    def __init__(self, features=None):
+        self._columns = dict()
+        self._cell_ids = list()
+        self._rows = list()
+        self.fixed_columns = features is not None
+        for feature in (features or []):
+            self._columns.setdefault(tuple(feature), len(self._columns))
+
+    @property
+    def features(self):
+        return list(self._columns)
+
+    def row(self, cell_dict):
+        """Returns the cell's values as a float64 array in column order, adding new columns if needed
+        (unless columns were fixed when creating the builder)"""
+
+        columns = self._columns
+        items = list()
+        for cell_part, feature_dict in cell_dict.items():
+            for feat_name, value in feature_dict.items():
+                j = columns.get((cell_part, feat_name))
+                if j is None:
+                    if self.fixed_columns:
+                        continue
+                    j = columns[(cell_part, feat_name)] = len(columns)
+                items.append((j, np.nan if value is None else value))
+
+        row = np.full(len(columns), np.nan)
+        for j, value in items:
+            row[j] = value
+        return row
+
+    def add(self, cell_ID, cell_dict):
+        """Adds a cell's row, returning it as a float64 array in column order"""
+
+        row = self.row(cell_dict)
+        self._cell_ids.append(cell_ID)
+        self._rows.append(row)
+        return row
+
+    def build(self, name=None):
+        n_features = len(self._columns)
+        values = np.full((len(self._rows), n_features), np.nan)
+        for i, row in enumerate(self._rows):
+            values[i, :len(row)] = row
+        cell_parts = [cell_part for cell_part, _ in self._columns]
+        feat_names = [feat_name for _, feat_name in self._columns]
+        return FeatureMatrix(values, self._cell_ids, cell_parts, feat_names, name=name)
+
+
+def pairwise_moments(values):
+    """Statistics of all pairs of columns of 'values' (cells x features), each pair of columns using
+    the rows where both values are available (i.e. not NaN). Returns the (features x features) arrays
+    'n', 'mean', 'var' and 'cov': number of rows used for the pair (i, j), mean and (population) variance
+    of column i over those rows, and (population) covariance of columns i and j"""
+
+    values = np.asarray(values, dtype=np.float64)
+    valid = np.isfinite(values).astype(np.float64)
+    # Columns are centered first (on the mean of their available values), so that large offsets
+    # do not cancel out in the sums below; the pairwise means are then subtracted exactly
+    with np.errstate(invalid='ignore'):
+        col_sums = np.where(valid > 0, values, 0.).sum(axis=0)
+        col_means = np.where(valid.sum(axis=0) > 0, col_sums / np.maximum(valid.sum(axis=0), 1.), 0.)
+    values_0 = np.where(valid > 0, values - col_means, 0.)
+
+    # Sums over the rows where both columns i and j are available: counts, sum of column i, sum of its squares,
+    # and sum of the products of columns i and j
+    counts = valid.T @ valid
+    sums = values_0.T @ valid
+    sums_sq = (values_0 ** 2).T @ valid
+    sums_prod = values_0.T @ values_0
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = sums / counts
+        var = sums_sq / counts - mean ** 2
+        cov = sums_prod / counts - mean * mean.T
+    return dict(n=counts, mean=mean + col_means[:, None], var=var, cov=cov)
+
+
+def pairwise_corr(values):
+    """Pearson correlation matrix of the columns of 'values' (cells x features), each pair of columns
+    using the rows where both values are available (i.e. not NaN), as pandas.DataFrame.corr does"""
+
+    moments = pairwise_moments(values)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = moments['cov'] / np.sqrt(moments['var'] * moments['var'].T)
+    return np.clip(corr, -1., 1.)
+
+
+def prune_features(values, threshold_corr=0.95, threshold_var=0.05):
+    """Selects the columns of 'values' (cells x features) to keep: columns whose variance is below
+    'threshold_var' are dropped and, of any group of columns whose absolute correlation is above
+    'threshold_corr', only the first one is kept (columns are chosen greedily, left to right).
+    Returns the sorted array of indices of the columns kept; 'values' is not modified"""
+
+    values = np.asarray(values, dtype=np.float64)
+    n_feats = values.shape[1]
+    with np.errstate(invalid='ignore'):
+        variances = np.nanvar(values, axis=0, ddof=1) if values.shape[0] > 1 else np.full(n_feats, np.nan)
+    # Columns with no variance (or no values) are correlated with nothing: drop them first
+    keep = ~(variances < threshold_var) & np.isfinite(variances)
+
+    high_corr = np.abs(pairwise_corr(values)) > threshold_corr
+    for j in np.flatnonzero(keep):
+        if high_corr[j, :j][keep[:j]].any():
+            keep[j] = False
+    return np.flatnonzero(keep)
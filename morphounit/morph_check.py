@@ -0,0 +1,145 @@
+"""In-process equivalent of NeuroM's `morph_check` app: the morphology file is loaded once,
+the checks enabled in the configuration are run on it, and the neuron built is returned
+for further use (e.g. for the cut-plane detection)"""
+
+import os
+import copy
+import logging
+from collections import OrderedDict
+
+import numpy as np
+from neurom.check import CheckResult, check_wrapper
+from neurom.check import neuron_checks, structural_checks
+from neurom.core.dataformat import COLS
+from neurom.fst import _neuritefunc as _nf
+from neurom.fst._core import FstNeuron
+from neurom.io.utils import load_data
+from neurom.exceptions import ConfigError
+
+L = logging.getLogger(__name__)
+
+
+class SectionPoints:
+    """
+    Points of all neurite sections of a neuron, concatenated in a single array
+    (in the order NeuroM's checks iterate them), so that point-wise checks run as array operations
+    """
+
+    def __init__(self, neuron):
+        sections = list(_nf.iter_sections(neuron))
+        self.section_ids = np.array([section.id for section in sections], dtype=int)
+        points_list = [section.points for section in sections]
+        self.sizes = np.array([len(points) for points in points_list], dtype=int)
+        self.points = np.concatenate(points_list) if points_list else np.empty((0, 4))
+        self.offsets = np.cumsum(self.sizes) - self.sizes
+
+        # Segments: pairs of consecutive points within the same section
+        segment_lengths = np.linalg.norm(np.diff(self.points[:, COLS.XYZ], axis=0), axis=1)
+        is_segment = np.ones(len(segment_lengths), dtype=bool)
+        is_segment[self.offsets[1:] - 1] = False  # Last point of a section -> first point of the next one
+        self.segment_lengths = segment_lengths[is_segment]
+        self.segment_sections = np.repeat(np.arange(len(sections)), np.maximum(self.sizes - 1, 0))
+        self.segment_index = np.arange(len(self.segment_lengths)) - \
+            np.repeat(self.offsets - np.arange(len(sections)), np.maximum(self.sizes - 1, 0))
+
+
+def has_all_nonzero_segment_lengths(section_points, threshold=0.0):
+    """Same as neurom.check.neuron_checks.has_all_nonzero_segment_lengths, with array operations"""
+
+    bad = np.flatnonzero(section_points.segment_lengths <= threshold)
+    bad_ids = list(zip(section_points.section_ids[section_points.segment_sections[bad]].tolist(),
+                       section_points.segment_index[bad].tolist()))
+    return CheckResult(len(bad_ids) == 0, bad_ids)
+
+
+def has_all_nonzero_section_lengths(section_points, threshold=0.0):
+    """Same as neurom.check.neuron_checks.has_all_nonzero_section_lengths, with array operations"""
+
+    section_lengths = np.bincount(section_points.segment_sections, weights=section_points.segment_lengths,
+                                  minlength=len(section_points.section_ids))
+    bad_ids = section_points.section_ids[section_lengths <= threshold].tolist()
+    return CheckResult(len(bad_ids) == 0, bad_ids)
+
+
+def has_all_nonzero_neurite_radii(section_points, threshold=0.0):
+    """Same as neurom.check.neuron_checks.has_all_nonzero_neurite_radii, with array operations"""
+
+    bad = np.flatnonzero(section_points.points[:, COLS.R] <= threshold)
+    point_sections = np.repeat(np.arange(len(section_points.sizes)), section_points.sizes)
+    bad_ids = list(zip(section_points.section_ids[point_sections[bad]].tolist(),
+                       (bad - section_points.offsets[point_sections[bad]]).tolist()))
+    return CheckResult(len(bad_ids) == 0, bad_ids)
+
+
+# Neuron checks run on the SectionPoints of the neuron; any other check is run by NeuroM
+VECTORIZED_CHECKS = {check.__name__: check for check in (has_all_nonzero_segment_lengths,
+                                                         has_all_nonzero_section_lengths,
+                                                         has_all_nonzero_neurite_radii)}
+
+
+def _sanitize_config(config):
+    """Copy of a morph_check configuration, with the keys missing added (as NeuroM's CheckRunner does)"""
+
+    config = copy.deepcopy(config)
+    if 'checks' not in config:
+        raise ConfigError('Need to have "checks" in the config')
+    config['checks'].setdefault('structural_checks', [])
+    config['checks'].setdefault('neuron_checks', [])
+    config.setdefault('options', {})
+    return config
+
+
+def _do_check(check_fun, obj, options):
+    check_str = check_fun.__name__
+    if check_str in options:
+        fargs = options[check_str]
+        if isinstance(fargs, list):
+            return check_wrapper(check_fun)(obj, *fargs)
+        return check_wrapper(check_fun)(obj, fargs)
+    return check_wrapper(check_fun)(obj)
+
+
+def run_morph_check(morph_path, config):
+    """
+    Runs the checks of a morph_check configuration, i.e. {'checks': {'structural_checks': [...],
+    'neuron_checks': [...]}, 'options': {...}}, on the morphology file 'morph_path'.
+    Returns the same summary as `morph_check`, {'files': {morph_path: {check title: bool, ..., 'ALL': bool}},
+    'STATUS': 'PASS' or 'FAIL'}, and the neuron (FstNeuron) built, or None if it could not be built
+    """
+    config = _sanitize_config(config)
+    options = config['options']
+
+    full_result = True
+    full_summary = OrderedDict()
+    neuron = None
+    try:
+        data = load_data(morph_path)
+    except Exception as e:
+        L.error("Failed to load data... skipping tests for this file")
+        L.error(e.args)
+        return {'files': {morph_path: OrderedDict([('ALL', False)])}, 'STATUS': 'FAIL'}, None
+
+    try:
+        for check_str in config['checks']['structural_checks']:
+            result = _do_check(getattr(structural_checks, check_str), data, options)
+            full_summary[result.title] = result.status
+            full_result &= result.status
+
+        neuron = FstNeuron(data, os.path.splitext(os.path.basename(morph_path))[0])
+        section_points = None
+        for check_str in config['checks']['neuron_checks']:
+            if check_str in VECTORIZED_CHECKS:
+                if section_points is None:
+                    section_points = SectionPoints(neuron)
+                result = _do_check(VECTORIZED_CHECKS[check_str], section_points, options)
+            else:
+                result = _do_check(getattr(neuron_checks, check_str), neuron, options)
+            full_summary[result.title] = result.status
+            full_result &= result.status
+    except Exception as e:
+        L.error("Check failed: %s", str(type(e)) + str(e.args))
+        full_result = False
+
+    full_summary['ALL'] = full_result
+
+    return {'files': {morph_path: full_summary}, 'STATUS': 'PASS' if full_result else 'FAIL'}, neuron
@@ -1,14 +1,9 @@
 """Loads MorphoUnit plot classes for NeuronUnit"""
 
-from os.path import dirname, basename, isfile
-import glob
+from morphounit._lazy import plugin_loader
 
 """
 NOTE: All plot files must have a prefix "plot_" and extension ".py".
-Only these would be loaded.
+Only these would be loaded; each one is imported on first access to any of its names.
 """
-files = glob.glob(dirname(__file__)+"/plot_*.py")
-modules = [ basename(f)[:-3] for f in files if isfile(f)]
-
-for module in modules:
-    exec("from .%s import *" % module)
+modules, __all__, __getattr__, __dir__ = plugin_loader(__name__, __file__, "plot_")
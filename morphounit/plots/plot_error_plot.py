@@ -1,8 +1,9 @@
 import matplotlib
 # Force matplotlib to not use any Xwindows backend.
 matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-from collections import OrderedDict
+import numpy as np
+
+from morphounit.artifacts import atomic_savefig, new_figure
 
 #==============================================================================
 
@@ -23,53 +24,54 @@ class ErrorPlot:
         self.xlabels = ["(not specified)"] # self.testObj.observation.keys()
         self.ylabel = "(not specified)"
 
-    def traverse_dicts(self, obs, prd, output = []):
-        # output will contain list with elements in the form:
-        # [("type", obs_mean, obs_std, prd_value), ... ] or
-        # [("type", obs_min, obs_max, prd_value), ... ]
+    def traverse_dicts(self, obs, prd):
+        # yields records in the form:
+        # ("type", obs_mean, obs_std, prd_value) or
+        # ("type", obs_min, obs_max, prd_value)
         # where "type" specifies whether observation is in the form of
-        # (mean,std) -> type="mean_sd", or (min,max) -> type="min_max"
-        od_obs = OrderedDict(sorted(obs.items(), key=lambda t: t[0]))
-        od_prd = OrderedDict(sorted(prd.items(), key=lambda t: t[0]))
-        flag = True
-
-        for key in od_obs.keys():
-            if flag is True:
-                if isinstance(od_obs[key], dict):
-                    self.traverse_dicts(od_obs[key], od_prd[key])
+        # (mean,std) -> type="mean_sd", or (min,max) -> type="min_max";
+        # keys are visited in sorted order, at all non-terminal levels
+        for key in sorted(obs.keys()):
+            if isinstance(obs[key], dict):
+                yield from self.traverse_dicts(obs[key], prd[key])
+            else:
+                if "mean" in obs.keys():
+                    yield ("mean_sd", obs["mean"], obs["std"], prd["value"])
+                elif "min" in obs.keys():
+                    yield ("min_max", obs["min"], obs["max"], prd["value"])
                 else:
-                    if "mean" in od_obs.keys():
-                        output.append(("mean_sd",od_obs["mean"],od_obs["std"],od_prd["value"]))
-                    elif "min" in od_obs.keys():
-                        output.append(("min_max",od_obs["min"],od_obs["max"],od_prd["value"]))
-                    else:
-                        print("Error in terminal keys!")
-                        raise
-                    flag = False
-        return output
+                    raise ValueError("Error in terminal keys! Expected ('mean', 'std') or ('min', 'max'), "
+                                     "found: %s" % sorted(obs.keys()))
+                return
 
     def create(self):
-        output = self.traverse_dicts(self.testObj.observation, self.testObj.prediction)
-        fig = plt.figure()
-        ix = 0
-        for (obs_type, obs_var1, obs_var2, prd_value) in output:
-            if obs_type == "mean_sd":
-                ax_o = plt.errorbar(ix, obs_var1, yerr=obs_var2, ecolor='black', elinewidth=2,
-                                    capsize=5, capthick=2, fmt='ob', markersize='5', mew=5)
-            elif obs_type == "min_max":
-                ax_o = plt.plot([ix, ix],[obs_var1, obs_var2],'_b-', markersize=8, mew=8, linewidth=2.5)
-            else:
-                # should never be executed
-                print("ERROR! Unknown type of observation data.")
-            ax_p = plt.plot(ix, prd_value, 'rx', markersize='8', mew=2)
-            ix = ix + 1
-        plt.xticks(range(len(output)), self.xlabels, rotation=20)
-        plt.tick_params(labelsize=11)
-        plt.figlegend((ax_o,ax_p[0]), ('Observation', 'Prediction',), 'upper right')
-        plt.margins(0.1)
-        plt.ylabel(self.ylabel)
-        fig = plt.gcf()
-        fig.set_size_inches(8, 6)
-        filepath = self.testObj.path_test_output + self.filename + '.pdf'
-        plt.savefig(filepath, dpi=600,)
+        output = list(self.traverse_dicts(self.testObj.observation, self.testObj.prediction))
+        ix = np.arange(len(output))
+        obs_type = np.array([record[0] for record in output])
+        obs_var1, obs_var2, prd_value = (np.array([float(record[k]) for record in output], dtype=float)
+                                         for k in (1, 2, 3))
+
+        with new_figure(figsize=(8, 6)) as fig:
+            ax = fig.subplots()
+            # One artist per kind of observation, and another one for all predictions
+            ax_o = None
+            mean_sd = obs_type == "mean_sd"
+            min_max = obs_type == "min_max"
+            if min_max.any():
+                mid = (obs_var1[min_max] + obs_var2[min_max]) / 2
+                ax_o = ax.errorbar(ix[min_max], mid, yerr=[mid - obs_var1[min_max], obs_var2[min_max] - mid],
+                                   fmt='none', ecolor='b', elinewidth=2.5, capsize=4, capthick=8)
+            if mean_sd.any():
+                ax_o = ax.errorbar(ix[mean_sd], obs_var1[mean_sd], yerr=obs_var2[mean_sd], ecolor='black', elinewidth=2,
+                                   capsize=5, capthick=2, fmt='ob', markersize='5', mew=5)
+            ax_p, = ax.plot(ix, prd_value, 'rx', markersize='8', mew=2)
+
+            ax.set_xticks(ix)
+            ax.set_xticklabels(self.xlabels, rotation=20)
+            ax.tick_params(labelsize=11)
+            fig.legend((ax_o, ax_p), ('Observation', 'Prediction',), loc='upper right')
+            ax.margins(0.1)
+            ax.set_ylabel(self.ylabel)
+            filepath = self.testObj.path_test_output + self.filename + '.pdf'
+            atomic_savefig(fig, filepath, dpi=600,)
         return filepath
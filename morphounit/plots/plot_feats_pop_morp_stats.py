@@ -1,12 +1,14 @@
 # For data manipulation
 import os
-from scipy import stats
-import pandas as pd
+from scipy import stats, ndimage
 import seaborn as sns
 import numpy as np
 import matplotlib
 matplotlib.use('Agg')  # Force matplotlib to not use any Xwindows backend.
-from matplotlib import pyplot as plt
+from matplotlib.colors import ListedColormap
+
+from morphounit.artifacts import atomic_savefig, new_figure
+from morphounit.feature_matrix import pairwise_moments, prune_features
 
 
 class FeatsPop_MorphStats:
@@ -15,8 +17,15 @@ class FeatsPop_MorphStats:
     in the form of correlation, countour and distribution plots
     """
 
-    def __init__(self, testObj):
+    def __init__(self, testObj, large_pop_threshold=2000):
         self.testObj = testObj
+        # Above this number of cells, the plots switch to a large-population mode: 2D histograms (hexbin)
+        # instead of scatter plots, and binned kernel density estimations, so that both the rendering time
+        # and the file size stay roughly constant as the population grows
+        self.large_pop_threshold = large_pop_threshold
+        # Resolution of the figures (which, in the large-population mode, only applies to their rasterized parts)
+        self.dpi = 600
+        self.large_pop_dpi = 150
         self.prefix_filename_lreg = "prediction_lreg_"
         self.prefix_filename_stats = "prediction_stats_"
         self.prefix_filename_stats_all = "prediction_allPlots_"
@@ -27,20 +36,14 @@ class FeatsPop_MorphStats:
         Formats a dictionary of cells population morpho-features
         into a dictionary of DataFrame structures
         """
-        pop_prediction_raw = self.testObj.prediction_cells_dict
-        prediction_raw = list(pop_prediction_raw.values())[0]
+        pop_prediction_matrix = self.testObj.prediction_cells_matrix
 
         dict_pred_CellPart_df = dict()
-        for CellPart in prediction_raw.keys():
-            dict_pred_CellPart_df[CellPart] = pd.DataFrame(prediction_raw[CellPart])
+        for CellPart in pop_prediction_matrix.cell_part_names():
+            dict_pred_CellPart_df[CellPart] = pop_prediction_matrix.frame(CellPart)
 
         return dict_pred_CellPart_df
 
-    def corrfunc(self, x, y, **kws):
-        r, p = stats.pearsonr(x, y)
-        ax = plt.gca()
-        ax.annotate(f"r = {r:.2E}\n(p ={p:.2E})", xy=(.1, .9), xycoords=ax.transAxes)
-
     def df_drop_features(self, df=None, threshold_corr=0.95, threshold_var=0.05):
         '''Drops one in any pair of highly correlated features of a DataFrame,
         as the calculation of some quantities may not be posible. Besides,
@@ -49,91 +52,219 @@ class FeatsPop_MorphStats:
         features may not be computed. The same holds for features with low variability.
 
         The cutoffs for correlation (or variance) to be considered as too high (or too low)
-        are given by 'threshold_corr' ('threshold_var').
+        are given by 'threshold_corr' ('threshold_var'). Of any group of highly correlated
+        features, the first one is kept (see morphounit.feature_matrix.prune_features).
 
         Note: Adapted from
         https://chrisalbon.com/machine_learning/feature_selection/
         drop_highly_correlated_features/
         '''
 
-        feats_to_drop = list()
-        # Compute the correlation DataFrame of the original DataFrame of feature values
-        corr_matrix_df = df.corr().abs()
-        # Build a copy with the elements below the first diagonal as False
-        upper = corr_matrix_df.where(np.triu(np.ones(corr_matrix_df.shape), k=1).astype(np.bool))
-        # Find and collect one feature name in any pair of correlated features
-        features_hcorr = [column for column in df.columns
-                          if any(upper[column] > threshold_corr)]
-        feats_to_drop.extend(features_hcorr)
-
-        # Compute the variance DataSeries of the original DataFrame of feature values
-        var_series = df.var().abs()
-        # Find and collect all features with low variance
-        feats_no_var = [column for column in df.columns
-                        if var_series[column] < threshold_var]
-        feats_to_drop.extend(feats_no_var)
-
-        # Drop all those disposable (maybe superfluous) features found
-        df.drop(df[feats_to_drop], axis=1, inplace=True)
-
-        return df
-
-    def FeaturesPop_Linreg_plots(self, dict_pred_CellPart_df=None):
-        '''Plots a histogram for values of each morpho-feature, in the diagonal,
-        together with a kernel density estimation (kde) for that histogram.
-        Linear correlation results are shown below and above the diagonal for
-        the same pair of morpho-feattures (i.e., numerical results are symmetric).
-        '''
-        for CellPart, prediction_raw_df in list(dict_pred_CellPart_df.items()):
-            data = self.df_drop_features(df=prediction_raw_df)
+        # Indices of the features kept, found on the (cells x features) matrix of values
+        kept = prune_features(df.to_numpy(dtype=float), threshold_corr=threshold_corr, threshold_var=threshold_var)
 
-            g = sns.pairplot(data, height=5, aspect=1, diag_kind="kde")
-            # g = sns.PairGrid(data, size=5, aspect=1, palette=["red"])
-            # g.map(sns.regplot)
-            # g.map(self.corrfunc)
-            g.map_upper(sns.regplot)
-            g.map_upper(self.corrfunc)
-            g.map_diag(sns.distplot, kde=True)
-            g.map_lower(sns.regplot)
-            g.map_lower(self.corrfunc)
+        # Returns a new DataFrame without all those disposable (maybe superfluous) features found
+        # (the original one is left as it is)
+        return df.iloc[:, kept]
 
-            plt.subplots_adjust(top=0.95)
-            g.fig.suptitle('Cell part: '+CellPart, fontsize=17)
+    @staticmethod
+    def linreg_stats(values):
+        """Pearson correlation coefficients, their two-sided p-values and the least-squares lines
+        for all pairs of columns of 'values' (cells x features), from the pairwise statistics of the columns.
+        Each pair (i, j) uses the cells where both features are available (missing values are NaN):
+        n[i, j] cells, where feature i has mean[i, j] and (population) variance var[i, j].
+        The line regressing feature i on feature j has slope[i, j] and intercept[i, j]
+        """
+        moments = pairwise_moments(values)
+        n_cells, mean, var = moments['n'], moments['mean'], moments['var']
+        dof = n_cells - 2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r = np.clip(moments['cov'] / np.sqrt(var * var.T), -1., 1.)
+            t = r * np.sqrt(dof / (1. - r ** 2))
+            p = 2 * stats.t.sf(np.abs(t), dof)
+            slope = moments['cov'] / var.T
+        intercept = mean - slope * mean.T
+        return dict(n=n_cells, mean=mean, var=var, r=r, p=p, slope=slope, intercept=intercept)
 
-            filepath = os.path.join(self.testObj.path_test_output, self.prefix_filename_lreg + CellPart + '_FSI_pop.pdf')
-            plt.savefig(filepath, dpi=600, )
-            self.filepath_list.append(filepath)
+    @staticmethod
+    def finite(*columns):
+        """The columns (1-D arrays of the same length), restricted to the cells where all of them are available"""
+
+        valid = np.logical_and.reduce([np.isfinite(column) for column in columns])
+        return [column[valid] for column in columns]
+
+    def large_pop(self, x):
+        return len(x) > self.large_pop_threshold
+
+    @staticmethod
+    def binned_kde_1d(x, n_bins=512):
+        """Binned kernel density estimation (Gaussian kernel, Scott's bandwidth) of a large sample:
+        the sample's histogram on a fine grid, smoothed by the kernel.
+        Returns the grid's bin centers and the density at them"""
+
+        bandwidth = x.std(ddof=1) * len(x) ** (-1. / 5)
+        edges = np.linspace(x.min() - 3 * bandwidth, x.max() + 3 * bandwidth, n_bins + 1)
+        hist, edges = np.histogram(x, bins=edges, density=True)
+        density = ndimage.gaussian_filter1d(hist, bandwidth / (edges[1] - edges[0]), mode='constant')
+        return (edges[:-1] + edges[1:]) / 2, density
+
+    @staticmethod
+    def binned_kde_2d(x, y, n_bins=128):
+        """Binned kernel density estimation (Gaussian kernel, Scott's bandwidth; no covariance between x and y)
+        of a large sample of pairs, on a grid. Returns the grid's bin centers for x and y, and the density
+        as an array indexed as [y_bin, x_bin] (as expected by 'contour')"""
+
+        factor = len(x) ** (-1. / 6)
+        bandwidths = np.array([x.std(ddof=1), y.std(ddof=1)]) * factor
+        x_edges = np.linspace(x.min() - 3 * bandwidths[0], x.max() + 3 * bandwidths[0], n_bins + 1)
+        y_edges = np.linspace(y.min() - 3 * bandwidths[1], y.max() + 3 * bandwidths[1], n_bins + 1)
+        hist, x_edges, y_edges = np.histogram2d(x, y, bins=[x_edges, y_edges], density=True)
+        bin_widths = np.array([x_edges[1] - x_edges[0], y_edges[1] - y_edges[0]])
+        density = ndimage.gaussian_filter(hist, bandwidths / bin_widths, mode='constant')
+        return (x_edges[:-1] + x_edges[1:]) / 2, (y_edges[:-1] + y_edges[1:]) / 2, density.T
+
+    def linreg_panel(self, ax, x, y, i, j, lstats, color="C0"):
+        """Scatter plot of feature j (x) vs. feature i (y) (a 2D histogram for large populations),
+        with their regression line, its 95% confidence band and the correlation coefficient;
+        returns the artists drawn. Cells where either feature is missing are left out"""
+
+        x, y = self.finite(x, y)
+        if len(x) < 2:
+            return list()
 
-    def FeaturesPop_ContourLinreg_plots(self, dict_pred_CellPart_df=None):
+        if self.large_pop(x):
+            artists = [ax.hexbin(x, y, gridsize=40, mincnt=1, cmap="Blues", rasterized=True)]
+        else:
+            artists = [ax.scatter(x, y, s=15, color=color, alpha=0.8)]
+
+        slope, intercept = lstats['slope'][i, j], lstats['intercept'][i, j]
+        n_cells, r = lstats['n'][i, j], lstats['r'][i, j]
+        x_grid = np.linspace(x.min(), x.max(), 100)
+        y_fit = intercept + slope * x_grid
+        artists.extend(ax.plot(x_grid, y_fit, color=color))
+        if n_cells > 2:
+            # Standard error of the fitted line
+            resid_var = lstats['var'][i, j] * (1. - r ** 2) * n_cells / (n_cells - 2)
+            x_mean, x_var = lstats['mean'][j, i], lstats['var'][j, i]
+            y_err = stats.t.ppf(0.975, n_cells - 2) * \
+                np.sqrt(resid_var * (1. / n_cells + (x_grid - x_mean) ** 2 / (n_cells * x_var)))
+            artists.append(ax.fill_between(x_grid, y_fit - y_err, y_fit + y_err, color=color, alpha=0.15,
+                                           linewidth=0))
+
+        artists.append(ax.annotate(f"r = {r:.2E}\n(p ={lstats['p'][i, j]:.2E})", xy=(.1, .9),
+                                   xycoords=ax.transAxes))
+        return artists
+
+    def dist_panel(self, ax, x, color="C0"):
+        """Histogram of a feature, together with its kernel density estimation (kde).
+        Cells where the feature is missing are left out"""
+
+        x, = self.finite(x)
+        if len(x) == 0:
+            return
+
+        if self.large_pop(x):
+            n_bins = min(len(np.histogram_bin_edges(x, bins='auto')) - 1, 100)
+            ax.hist(x, bins=n_bins, density=True, color=color, alpha=0.4, rasterized=True)
+            ax.plot(*self.binned_kde_1d(x), color=color)
+            return
+
+        ax.hist(x, bins='auto', density=True, color=color, alpha=0.4)
+        try:
+            x_grid = np.linspace(x.min(), x.max(), 200)
+            ax.plot(x_grid, stats.gaussian_kde(x)(x_grid), color=color)
+        except (np.linalg.LinAlgError, ValueError):
+            pass
+
+    def kde_contour_panel(self, ax, x, y, n_levels=8):
+        """Contour plot of the joint kernel density estimation (kde) of two features.
+        Cells where either feature is missing are left out"""
+
+        x, y = self.finite(x, y)
+        if len(x) < 3 or x.std() == 0 or y.std() == 0:
+            # Not enough data for a (non-singular) joint distribution
+            return
+
+        levels = n_levels
+        if self.large_pop(x):
+            x_grid, y_grid, density = self.binned_kde_2d(x, y)
+            # Evenly spaced levels, above the density of the sparsely populated bins in the tails
+            levels = density.max() * np.arange(1, n_levels + 1) / (n_levels + 1)
+        else:
+            try:
+                kde = stats.gaussian_kde(np.vstack([x, y]))
+            except (np.linalg.LinAlgError, ValueError):
+                return
+            x_grid, y_grid = np.meshgrid(np.linspace(x.min(), x.max(), 100), np.linspace(y.min(), y.max(), 100))
+            density = kde(np.vstack([x_grid.ravel(), y_grid.ravel()])).reshape(x_grid.shape)
+        ax.contour(x_grid, y_grid, density, levels=levels, cmap=ListedColormap(sns.color_palette("Blues_d")))
+
+    def FeaturesPop_pairplots(self, CellPart, data):
         '''Plots a histogram for values of each morpho-feature, in the diagonal,
         together with a kernel density estimation (kde) for that histogram.
-        Linear correlation results and contour (kde) plots for the same pair of
-        morpho-feattures are shown above and below the diagonal, respectively.
+        Linear correlation results are shown above the diagonal. Below the diagonal,
+        the same linear correlation results (first figure) or contour (kde) plots (second figure)
+        for the same pair of morpho-features are shown.
 
-        Note that some morpho-features are excluded from the analysis, when their
-        correlation is high , as their (kde) countour-plots can not be computed.
+        Both figures share a single grid, rendered once: the correlations and regression lines
+        are computed all at once, from the correlation matrix of the features.
         '''
-        for CellPart, prediction_raw_df in list(dict_pred_CellPart_df.items()):
-            data = self.df_drop_features(df=prediction_raw_df)
+        feat_names = list(data.columns)
+        values = data.to_numpy(dtype=float)
+        n_feats = len(feat_names)
+        lstats = self.linreg_stats(values)
+        dpi = self.large_pop_dpi if self.large_pop(values) else self.dpi
+
+        with new_figure(figsize=(5 * n_feats, 5 * n_feats)) as fig:
+            # All panels in a column share the x-axis (j-th feature), and all panels in a row the y-axis (i-th)
+            axes = fig.subplots(n_feats, n_feats, squeeze=False, sharex='col', sharey='row')
+            lower_artists = list()
+            for i in range(n_feats):
+                for j in range(n_feats):
+                    ax = axes[i, j]
+                    if i == j:
+                        # Distributions are drawn on a twin axis, with their own (hidden) y-scale
+                        diag_ax = ax.twinx()
+                        diag_ax.tick_params(right=False, labelright=False)
+                        self.dist_panel(diag_ax, values[:, j])
+                        continue
+                    artists = self.linreg_panel(ax, values[:, j], values[:, i], i, j, lstats)
+                    if i > j:
+                        lower_artists.append((i, j, artists))
+
+            for i in range(n_feats):
+                axes[i, 0].set_ylabel(feat_names[i])
+                axes[-1, i].set_xlabel(feat_names[i])
+                for j in range(n_feats):
+                    if i < n_feats - 1:
+                        axes[i, j].tick_params(labelbottom=False)
+                    if j > 0:
+                        axes[i, j].tick_params(labelleft=False)
 
-            g = sns.pairplot(data, height=5, aspect=1, diag_kind="kde")
-            # g = sns.PairGrid(data, size=5, aspect=1, palette=["red"]
-            g.map_upper(sns.regplot)
-            g.map_upper(self.corrfunc)
-            # g.map_upper(plt.reg, s=10)
-            g.map_diag(sns.distplot, kde=True)
-            g.map_lower(sns.kdeplot, cmap="Blues_d", n_levels=8)
+            fig.subplots_adjust(top=0.95)
+            fig.suptitle('Cell part: ' + CellPart, fontsize=17)
 
-            plt.subplots_adjust(top=0.95)
-            g.fig.suptitle('Cell part: ' + CellPart, fontsize=17)
+            filepath = os.path.join(self.testObj.path_test_output, self.prefix_filename_lreg + CellPart + '_FSI_pop.pdf')
+            atomic_savefig(fig, filepath, dpi=dpi)
+            self.filepath_list.append(filepath)
+
+            # Second figure: replaces the linear correlation results below the diagonal by the contour plots
+            for i, j, artists in lower_artists:
+                for artist in artists:
+                    artist.remove()
+                self.kde_contour_panel(axes[i, j], values[:, j], values[:, i])
 
             filepath = os.path.join(self.testObj.path_test_output, self.prefix_filename_stats_all + CellPart + '_FSI_pop.pdf')
-            plt.savefig(filepath, dpi=600, )
+            atomic_savefig(fig, filepath, dpi=dpi)
             self.filepath_list.append(filepath)
 
     def create(self):
         Dict_CellPart_DFrame_pred = self.FeaturesPop_dict_DFrame()
-        self.FeaturesPop_Linreg_plots(dict_pred_CellPart_df=Dict_CellPart_DFrame_pred)
-        self.FeaturesPop_ContourLinreg_plots(dict_pred_CellPart_df=Dict_CellPart_DFrame_pred)
+        for CellPart, prediction_raw_df in Dict_CellPart_DFrame_pred.items():
+            data = self.df_drop_features(df=prediction_raw_df)
+            if data.shape[1] == 0:
+                # No morpho-features left to plot for this cell part
+                continue
+            self.FeaturesPop_pairplots(CellPart, data)
 
         return self.filepath_list
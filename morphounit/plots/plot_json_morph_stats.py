@@ -1,35 +1,56 @@
 import json
 import os
 
+from morphounit.artifacts import atomic_open
+
 
 class jsonFile_MorphStats:
     """
-    Displays data as a dictionary inside a json file
+    Displays data as a dictionary inside a json file:
+    one file per top-level key (e.g. cell ID) holding only that key's data or,
+    if 'json_lines' is True, a single JSON Lines file with one compact record per key
     """
 
-    def __init__(self, testObj, dictData, prefix_name):
+    def __init__(self, testObj, dictData, prefix_name, json_lines=False):
 
         self.testObj = testObj
         self.dictData = dictData
         self.prefix_filename = prefix_name
+        self.json_lines = json_lines
         self.filepath_list = list()
 
     def score_jsonFile(self, filepath=None, data_dict=None):
 
-        with open(filepath, 'w') as dataFile:
+        with atomic_open(filepath, 'w') as dataFile:
             json.dump(data_dict, dataFile, sort_keys=True, indent=4)
 
         self.filepath_list.append(filepath)
         return self.filepath_list
 
+    def score_jsonLinesFile(self, filepath=None, data_dict=None):
+        """Streams the data to a JSON Lines file, one {key: value} record per line"""
+
+        with atomic_open(filepath, 'w') as dataFile:
+            for key_0, value in data_dict.items():
+                dataFile.write(json.dumps({key_0: value}, sort_keys=True, separators=(',', ':')))
+                dataFile.write('\n')
+
+        self.filepath_list.append(filepath)
+        return self.filepath_list
+
     def create(self):
 
+        if self.json_lines:
+            filepath_summary = \
+                os.path.join(self.testObj.path_test_output, self.prefix_filename + 'cells.jsonl')
+            return self.score_jsonLinesFile(filepath=filepath_summary, data_dict=self.dictData)
+
         for key_0 in self.dictData:  # cell ID keys
 
             json_name = key_0
             filepath_summary_cell = \
                 os.path.join(self.testObj.path_test_output, self.prefix_filename + json_name + '.json')
 
-            self.score_jsonFile(filepath=filepath_summary_cell, data_dict=self.dictData)
+            self.score_jsonFile(filepath=filepath_summary_cell, data_dict={key_0: self.dictData[key_0]})
 
         return self.filepath_list
@@ -0,0 +1,60 @@
+import csv
+import os
+
+import numpy as np
+
+from morphounit.artifacts import atomic_open
+from morphounit.units import parse_units
+
+
+class ResultsTable_MorphStats:
+    """
+    Saves the results of all cells in a single, tidy table (TSV or CSV file),
+    one row per cell and morpho-feature, written row by row from the columns of the
+    observation (QuantityTable), prediction and Z-scores (cells x features FeatureMatrix).
+    Observation and prediction values are given as magnitudes, in the units of the 'units' column.
+    For human-readable tables, see TxtTable_MorphStats
+    """
+
+    header = ["cell_ID", "part", "feature", "obs_mean", "obs_std", "pred_value", "z_score", "units"]
+
+    def __init__(self, testObj, file_format='tsv'):
+
+        self.testObj = testObj
+        self.prefix_filename = "results_summary"
+        if file_format not in ('tsv', 'csv'):
+            raise ValueError("Results table format must be 'tsv' or 'csv', not %r" % file_format)
+        self.file_format = file_format
+        self.filepath_list = list()
+
+    def rows(self):
+        """Yields the table's rows, cells and features sorted by name"""
+
+        observation = self.testObj.observation
+        pred_matrix = self.testObj.prediction_matrix  # Columns in the order (and units) of the observation
+        score_matrix = self.testObj.score_matrix
+
+        features = list(zip(pred_matrix.cell_parts, pred_matrix.feat_names))
+        obs_mean = observation.column('mean').tolist()
+        obs_std = observation.column('std').tolist()
+        units_strs = [parse_units(units_str).dimensionality.string for units_str in observation.units_strs]
+
+        feat_order = sorted(range(len(features)), key=features.__getitem__)
+        for i in np.argsort(pred_matrix.cell_ids, kind='stable'):
+            pred_row = pred_matrix.values[i].tolist()
+            score_row = score_matrix.values[i].tolist()
+            for j in feat_order:
+                yield [pred_matrix.cell_ids[i], features[j][0], features[j][1], obs_mean[j], obs_std[j],
+                       pred_row[j], score_row[j], units_strs[j]]
+
+    def create(self):
+
+        filepath = os.path.join(self.testObj.path_test_output, self.prefix_filename + '.' + self.file_format)
+        with atomic_open(filepath, 'w', newline='') as dataFile:
+            writer = csv.writer(dataFile, delimiter='\t' if self.file_format == 'tsv' else ',')
+            writer.writerow(self.header)
+            for row in self.rows():
+                writer.writerow(row)
+
+        self.filepath_list.append(filepath)
+        return self.filepath_list
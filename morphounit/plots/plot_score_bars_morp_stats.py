@@ -2,13 +2,17 @@
 import numpy as np
 import pandas as pd
 
+from scipy import stats
+
 import matplotlib
 matplotlib.use('Agg')  # Force matplotlib to not use any Xwindows backend.
+from matplotlib.backends.backend_pdf import PdfPages
 
-from matplotlib import pyplot as plt
 import seaborn as sns
 import os
 
+from morphounit.artifacts import atomic_savefig, atomic_path, new_figure
+
 
 class ScoresBars_MorphStats:
     """
@@ -16,42 +20,110 @@ class ScoresBars_MorphStats:
     in the form of barplots
     """
 
-    def __init__(self, testObj):
+    def __init__(self, testObj, report=False, dpi=600, rasterized=False):
         self.testObj = testObj
         # self.prefix_filename_cells = "score_bars_cells"
         self.prefix_filename_cell_feat = "score_barPlots_"
+        self.filename_report = "score_barPlots_report"
         self.filepath_list = list()
 
+        # If True, the bar-plots of all cells are saved as the pages of a single PDF file (report),
+        # instead of a PDF file per cell
+        self.report = report
+        # Resolution of the figures and, if 'rasterized', bars drawn as images (e.g. with a lower 'dpi',
+        # for lighter files)
+        self.dpi = dpi
+        self.rasterized = rasterized
+
     def score_barplot(self, filepath=None, scores_floats={}, score_label=None,
                       xlabel=None, x_fontsize=5, ylabel=None, y_fontsize=5, title=None):
 
-        fig = plt.figure()
-
-        # pal = sns.cubehelix_palette(len(scores_floats))
-        pal = sns.color_palette('Reds', len(scores_floats))
-
         scores_floats_df = pd.DataFrame(scores_floats, index=[score_label]).transpose()
 
-        rank = [int(value) - 1 for value in scores_floats_df[score_label].rank()]
-        axis_obj = sns.barplot(x=scores_floats_df[score_label], y=scores_floats_df.index, palette=np.array(pal)[rank])
+        with new_figure() as fig:
+            axis_obj = fig.subplots()
+            sns.barplot(x=scores_floats_df[score_label], y=scores_floats_df.index,
+                        palette=self.bar_colors(scores_floats_df[score_label]), ax=axis_obj)
+
+            fig.subplots_adjust(left=0.3)
+            axis_obj.set(xlabel=xlabel, ylabel=ylabel)
+            # axis_obj.set_ylabel(ylabel, fontsize=y_fontsize)
+            # axis_obj.set_xlabel(xlabel, fontsize=x_fontsize)
+            axis_obj.set_yticklabels(axis_obj.get_yticklabels(), fontsize=y_fontsize)
+            # axis_obj.set_xticklabels(axis_obj.get_xticklabels(), fontsize=x_fontsize)
+            axis_obj.set_title(title, fontsize=7)
 
-        plt.subplots_adjust(left=0.3)
-        axis_obj.set(xlabel=xlabel, ylabel=ylabel)
-        # axis_obj.set_ylabel(ylabel, fontsize=y_fontsize)
-        # axis_obj.set_xlabel(xlabel, fontsize=x_fontsize)
-        axis_obj.set_yticklabels(axis_obj.get_yticklabels(), fontsize=y_fontsize)
-        # axis_obj.set_xticklabels(axis_obj.get_xticklabels(), fontsize=x_fontsize)
-        axis_obj.axes.set_title(title, fontsize=7)
+            # sns.despine()
 
-        # sns.despine()
+            if self.rasterized:
+                for patch in axis_obj.patches:
+                    patch.set_rasterized(True)
 
-        plt.savefig(filepath, dpi=600, )
+            atomic_savefig(fig, filepath, dpi=self.dpi)
         self.filepath_list.append(filepath)
 
-        plt.close(fig)
+        return self.filepath_list
+
+    @staticmethod
+    def bar_colors(scores_floats):
+        """Colors of the bars, according to the rank of their scores (missing scores rank as zeros)"""
 
+        # pal = sns.cubehelix_palette(len(scores_floats))
+        scores_array = np.nan_to_num(np.asarray(scores_floats, dtype=float))
+        pal = np.array(sns.color_palette('Reds', len(scores_array)))
+        rank = [int(value) - 1 for value in stats.rankdata(scores_array)]
+        return pal[rank]
+
+    def score_barplot_report(self, filepath=None, cells_scores_floats=(), score_label=None,
+                             xlabel=None, ylabel=None, y_fontsize=5):
+        """Saves the bar-plots of several cells, (title, scores_floats) pairs, as the pages of a single PDF file.
+        The same figure and bars are reused for all pages: only their lengths, colors and labels are updated
+        (the bars are only drawn again when the number of features changes)"""
+
+        with new_figure() as fig, atomic_path(filepath) as tmp_filepath, PdfPages(tmp_filepath) as pdf_pages:
+            axis_obj = fig.subplots()
+            fig.subplots_adjust(left=0.3)
+            bars = None
+            for title, scores_floats in cells_scores_floats:
+                feat_names = list(scores_floats.keys())
+                scores_array = np.array(list(scores_floats.values()), dtype=float)
+
+                if bars is None or len(bars) != len(feat_names):
+                    axis_obj.clear()
+                    bars = axis_obj.barh(np.arange(len(feat_names)), np.zeros(len(feat_names)), height=0.8,
+                                         rasterized=self.rasterized)
+                    axis_obj.set_yticks(np.arange(len(feat_names)))
+                    axis_obj.set_ylim(len(feat_names) - 0.5, -0.5)  # First feature on top
+                    axis_obj.set(xlabel=xlabel or score_label, ylabel=ylabel)
+
+                for bar, width, color in zip(bars, np.nan_to_num(scores_array), self.bar_colors(scores_array)):
+                    bar.set_width(width)
+                    bar.set_color(color)
+                axis_obj.set_yticklabels(feat_names, fontsize=y_fontsize)
+                max_score = np.nanmax(scores_array) if np.isfinite(scores_array).any() else 0.
+                axis_obj.set_xlim(0, 1.05 * max_score if max_score > 0 else 1.)
+                axis_obj.set_title(title, fontsize=7)
+
+                pdf_pages.savefig(fig, dpi=self.dpi)
+
+        self.filepath_list.append(filepath)
         return self.filepath_list
 
+    def cells_scores_floats(self):
+        """Yields the (cell ID, {'cell_part.feature_name': |score|}) pairs of the test's scores"""
+
+        scores_dict = self.testObj.score_feat_dict
+        for key_0 in scores_dict:  # cell ID keys
+            scores_feat_floats = dict()
+            for key_1 in scores_dict[key_0]:  # cell's part keys: soma, axon, apical_dendrite or basal_dendrite
+                if 'score' in key_1:  # Excluding the overall cell's score
+                    continue
+                for key_2 in scores_dict[key_0][key_1]:  # features name keys
+
+                    feat_name = f"{key_1}.{key_2}"
+                    scores_feat_floats[feat_name] = abs(scores_dict[key_0][key_1][key_2]["score"])
+            yield key_0, scores_feat_floats
+
     def create(self):
 
         # --------------------------- Plotting overall cell scores -------------------------------------------------
@@ -71,22 +143,16 @@ class ScoresBars_MorphStats:
 
         score_label = "|Z-Score|"
 
-        scores_dict = self.testObj.score_feat_dict
-        for key_0 in scores_dict:  # cell ID keys
-            plt_title = key_0
+        if self.report:
+            filepath_report = os.path.join(self.testObj.path_test_output, self.filename_report + '.pdf')
+            return self.score_barplot_report(filepath=filepath_report, cells_scores_floats=self.cells_scores_floats(),
+                                             score_label=score_label, xlabel=score_label,
+                                             ylabel='morpho-features', y_fontsize=6)
+
+        for plt_title, scores_feat_floats in self.cells_scores_floats():
             filepath_score_feat = \
                 os.path.join(self.testObj.path_test_output, self.prefix_filename_cell_feat + plt_title + '.pdf')
 
-            scores_feat_floats = dict()
-            for key_1 in scores_dict[key_0]:  # cell's part keys: soma, axon, apical_dendrite or basal_dendrite
-                if 'score' in key_1:  # Excluding the overall cell's score
-                    continue
-                for key_2 in scores_dict[key_0][key_1]:  # features name keys
-
-                    feat_name = f"{key_1}.{key_2}"
-                    scores_feat_floats[feat_name] = abs(scores_dict[key_0][key_1][key_2]["score"])
-
-            plt.close('all')
             self.score_barplot(filepath=filepath_score_feat, scores_floats=scores_feat_floats, score_label=score_label,
                                xlabel=score_label, x_fontsize=7, ylabel='morpho-features', y_fontsize=6, title=plt_title)
 
@@ -6,6 +6,8 @@ import quantities
 import os
 import json
 
+from morphounit.artifacts import atomic_open
+
 
 class TxtTable_MorphStats:
     """
@@ -29,21 +31,19 @@ class TxtTable_MorphStats:
 
     def score_TxtTable(self, filepath=None, cell_ID=None, score_label=None, row_list=[]):
 
-        dataFile = open(filepath, 'w')
-
-        dataFile.write("============================================================================================\n")
-        dataFile.write("Test Name: %s\n" % self.testObj.name)
-        dataFile.write("Model Name: %s\n\n" % cell_ID)
+        with atomic_open(filepath, 'w') as dataFile:
 
-        header_list = ["Morphological feature", "Expt. mean", "Expt. std", "Model value", "Score"]
-        dataFile.write(tabulate(row_list, headers=header_list, tablefmt='orgtbl', stralign='right'))
-        dataFile.write("\n-----------------------------------------------------------------------------------------"
-                       "------------\n\n")
+            dataFile.write("============================================================================================\n")
+            dataFile.write("Test Name: %s\n" % self.testObj.name)
+            dataFile.write("Model Name: %s\n\n" % cell_ID)
 
-        dataFile.write("Final Score: %s (%s)\n" % (self.testObj.score_cell_dict[cell_ID][score_label], score_label))
-        dataFile.write("============================================================================================\n")
+            header_list = ["Morphological feature", "Expt. mean", "Expt. std", "Model value", "Score"]
+            dataFile.write(tabulate(row_list, headers=header_list, tablefmt='orgtbl', stralign='right'))
+            dataFile.write("\n-----------------------------------------------------------------------------------------"
+                           "------------\n\n")
 
-        dataFile.close()
+            dataFile.write("Final Score: %s (%s)\n" % (self.testObj.score_cell_dict[cell_ID][score_label], score_label))
+            dataFile.write("============================================================================================\n")
 
         self.filepath_list.append(filepath)
         return self.filepath_list
@@ -52,7 +52,7 @@ class TxtTable_MorphStats:
 
         score_label = "A mean |Z-score|"
 
-        cell_t = list(self.testObj.observation.keys())[0]  # Cell type
+        cell_t = self.testObj.observation.paths[0][0]  # Cell type
         for key_0 in sorted(self.testObj.score_feat_dict):  # cell ID keys
 
             tab_title = key_0
@@ -68,9 +68,9 @@ class TxtTable_MorphStats:
 
                 for key_2 in sorted(self.testObj.score_feat_dict[key_0][key_1]):  # features name keys
 
-                    o_mean = self.quant_to_str(self.testObj.observation[cell_t][key_1][key_2]["mean"])
-                    o_std = self.quant_to_str(self.testObj.observation[cell_t][key_1][key_2]["std"])
-                    p_value = self.quant_to_str(self.testObj.prediction[key_0][key_1][key_2]["value"])
+                    o_mean = self.quant_to_str(self.testObj.observation.quantity((cell_t, key_1, key_2), "mean"))
+                    o_std = self.quant_to_str(self.testObj.observation.quantity((cell_t, key_1, key_2), "std"))
+                    p_value = self.quant_to_str(self.testObj.prediction.quantity((key_0, key_1, key_2), "value"))
                     score = self.testObj.score_feat_dict[key_0][key_1][key_2]["score"]
 
                     feat_name = f"{key_1}.{key_2}"
@@ -0,0 +1,100 @@
+import numpy as np
+
+from morphounit.feature_matrix import FeatureMatrixBuilder
+
+
+class PopulationAccumulator:
+    """
+    Streaming aggregation of the morpho-features of a population of cells.
+    Cells are consumed one at a time and, for each (cell part, feature) pair, running
+    mean, variance (Welford's algorithm), minimum and maximum are kept, so memory
+    does not grow with the size of the population. Each cell is turned into a row of
+    the (cells x features) layout of FeatureMatrix, and all features are updated at once.
+    Per-cell raw values are also kept (e.g. for plotting), unless 'keep_raw' is False.
+    """
+
+    def __init__(self, keep_raw=True):
+        self.keep_raw = keep_raw
+        self.n_cells = 0
+        self._builder = FeatureMatrixBuilder()
+        self._count = np.zeros(0)
+        self._mean = np.zeros(0)
+        self._M2 = np.zeros(0)
+        self._min = np.zeros(0)
+        self._max = np.zeros(0)
+
+    def _grow(self, n_features):
+        n_new = n_features - len(self._count)
+        if n_new > 0:
+            self._count = np.append(self._count, np.zeros(n_new))
+            self._mean = np.append(self._mean, np.zeros(n_new))
+            self._M2 = np.append(self._M2, np.zeros(n_new))
+            self._min = np.append(self._min, np.full(n_new, np.nan))
+            self._max = np.append(self._max, np.full(n_new, np.nan))
+
+    def add(self, cell_dict, cell_ID=None):
+        """Adds a cell, given as {'cell_part_1': {'morph_feature_name_11': X11, ...}, ...}"""
+
+        self.n_cells += 1
+        if self.keep_raw:
+            row = self._builder.add(cell_ID, cell_dict)
+        else:
+            row = self._builder.row(cell_dict)
+        self._grow(len(row))
+
+        valid = ~np.isnan(row)
+        self._count[valid] += 1
+        delta = row[valid] - self._mean[valid]
+        self._mean[valid] += delta / self._count[valid]
+        self._M2[valid] += delta * (row[valid] - self._mean[valid])
+        self._min = np.fmin(self._min, row)
+        self._max = np.fmax(self._max, row)
+
+    def extend(self, cells):
+        """Adds the cells from an iterable of (cell_ID, cell_dict) pairs, e.g. a generator"""
+
+        for cell_ID, cell_dict in cells:
+            self.add(cell_dict, cell_ID=cell_ID)
+        return self
+
+    def raw_matrix(self, name=None):
+        """FeatureMatrix (cells x features) with the per-cell raw values, or None if they were not kept"""
+
+        return self._builder.build(name=name) if self.keep_raw else None
+
+    @property
+    def raw(self):
+        """Per-cell raw values, as {cell_part: {feat_name: [X_cell1, X_cell2, ...]}} (None if not kept)"""
+
+        return self.raw_matrix().to_columns() if self.keep_raw else None
+
+    def _valid_mean(self):
+        # Features without any valid value (e.g. None, for empty neurites) have no mean
+        return np.where(self._count > 0, self._mean, np.nan)
+
+    def mean(self):
+        """Returns {'cell_part_1': {'morph_feature_name_11': mean_X11, ...}, ...}
+        (NaN for features without any valid value)"""
+
+        mean_dict = dict()
+        for (cell_part, feat_name), mean in zip(self._builder.features, self._valid_mean().tolist()):
+            mean_dict.setdefault(cell_part, dict())[feat_name] = mean
+        return mean_dict
+
+    def summary(self):
+        """Returns, for each cell part and feature, the number of cells, mean, (population) variance
+        and standard deviation, minimum and maximum values:
+        {'cell_part_1': {'morph_feature_name_11': {'n': N, 'mean': X, 'var': V, 'std': S, 'min': m, 'max': M},
+                         ... },
+         ... }"""
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            var = self._M2 / self._count
+        stats = zip(self._builder.features, self._count.tolist(), self._valid_mean().tolist(), var.tolist(),
+                    np.sqrt(var).tolist(), self._min.tolist(), self._max.tolist())
+
+        summary_dict = dict()
+        for (cell_part, feat_name), count, mean, var_val, std, min_val, max_val in stats:
+            summary_dict.setdefault(cell_part, dict())[feat_name] = \
+                {'n': int(count), 'mean': mean, 'var': var_val, 'std': std, 'min': min_val, 'max': max_val}
+        return summary_dict
@@ -1,4 +1,5 @@
 import math
+import numpy as np
 import sciunit
 
 #==============================================================================
@@ -28,6 +29,30 @@ class CombineZScores(sciunit.Score):
         score = sum(map(abs,input_scores)) / len(input_scores)
         return CombineZScores(score)
 
+    @staticmethod
+    def compute_zscores(obs_mean, obs_std, pred_values):
+        """
+        Vectorized counterpart of sciunit.scores.ZScore.compute, for many
+        predictions at once. Observation's means and standard deviations
+        (1-D arrays of n features) are broadcast against the predicted values
+        (a cells x features array, or a single row), all in the same units.
+
+        Returns the array of Z-scores, with NaN wherever the observation's
+        standard deviation is not positive or any input value is NaN.
+        """
+        obs_std = np.asarray(obs_std, dtype=float)
+        obs_std = np.where(obs_std > 0, obs_std, np.nan)
+        return (np.asarray(pred_values, dtype=float) - np.asarray(obs_mean, dtype=float)) / obs_std
+
+    @staticmethod
+    def compute_array(z_scores):
+        """
+        Vectorized counterpart of compute: combines each row of a
+        (cells x features) array of Z-scores into the mean of its absolute values.
+        Returns the 1-D array with a combined score per row.
+        """
+        return np.mean(np.abs(z_scores), axis=-1)
+
     _description = ("Combining Z-scores between observation and prediction")
 
     @property
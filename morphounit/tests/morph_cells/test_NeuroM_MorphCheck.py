@@ -2,14 +2,16 @@ import sciunit
 from sciunit.scores import BooleanScore
 # import morphounit.capabilities as cap
 import morphounit.plots as plots
+from morphounit.artifacts import unique_run_dir, atomic_open, atomic_path
+from morphounit.morph_check import run_morph_check
 
 import os
-from subprocess import call
-import shlex
 import json
-from datetime import datetime
 
-import matplotlib.backends.backend_pdf
+import matplotlib
+matplotlib.use('Agg')  # Force matplotlib to not use any Xwindows backend.
+from matplotlib import pyplot as plt
+from matplotlib.backends.backend_pdf import PdfPages
 from neurom.apps.cut_plane_detection import find_cut_plane
 from neurom import load_neuron
 import numpy
@@ -42,9 +44,7 @@ class NeuroM_MorphoCheck(sciunit.Test):
     def generate_prediction(self, model, verbose=False):
         """Implementation of sciunit.Test.generate_prediction."""
         self.model_version = model.model_version
-        self.path_test_output = os.path.join(self.base_directory, 'validation_results', 'neuroM_morph_hardChecks', self.model_version, datetime.now().strftime("%Y%m%d-%H%M%S"))
-        if not os.path.exists(self.path_test_output):
-            os.makedirs(self.path_test_output)
+        self.path_test_output = unique_run_dir(self.base_directory, 'validation_results', 'neuroM_morph_hardChecks', self.model_version)
 
         # note: observation here is either the contents of the config file or a local path
         # if local path load contents
@@ -53,24 +53,32 @@ class NeuroM_MorphoCheck(sciunit.Test):
                 self.observation = json.load(f)
         # save morph_check config as local file
         morph_check_config_file = os.path.join(self.path_test_output, "morph_check_config.json")
-        with open(morph_check_config_file,'w') as f:
+        with atomic_open(morph_check_config_file,'w') as f:
             json.dump(self.observation["morph_check"], f, indent=4)
         cut_plane_config = self.observation["cut_plane"]
 
+        # run morph_check's checks in-process: the morphology is loaded once, and the neuron built
+        # is reused for the cut-plane detection (unless it could not be built)
+        prediction, neuron = run_morph_check(model.morph_path, self.observation["morph_check"])
         morhpcheck_output_file = os.path.join(self.path_test_output, "morph_check_output.json")
-        call(shlex.split(f"morph_check -C {morph_check_config_file} -o {morhpcheck_output_file} {model.morph_path}"))
-        with open(morhpcheck_output_file) as json_data:
-            prediction = json.load(json_data)
-
-        cut_plane_output_json = find_cut_plane(load_neuron(model.morph_path), bin_width=cut_plane_config["bin_width"], display=True)
-        cut_plane_figure_list = []
-        for key in cut_plane_output_json["figures"].keys():
-            cut_plane_figure_list.append(cut_plane_output_json["figures"][key][0])
+        with atomic_open(morhpcheck_output_file, 'w') as f:
+            json.dump(prediction, f, indent=4)
+
+        if neuron is None:
+            neuron = load_neuron(model.morph_path)
+        cut_plane_output_json = find_cut_plane(neuron, bin_width=cut_plane_config["bin_width"], display=True)
+        # NeuroM creates these figures through pyplot: they are saved by reference (not by global figure number)
+        # and closed right away, so that pyplot does not keep them alive
+        cut_plane_figure_list = [figure for figure, _ in cut_plane_output_json["figures"].values()]
         cutplane_output_pdf = os.path.join(self.path_test_output, "cut_plane_figures.pdf")
-        cut_plane_pdf = matplotlib.backends.backend_pdf.PdfPages(cutplane_output_pdf)
-        for fig in range(1, len(cut_plane_figure_list)+1):
-            cut_plane_pdf.savefig(fig)
-        cut_plane_pdf.close()
+        try:
+            with atomic_path(cutplane_output_pdf) as tmp_output_pdf:
+                with PdfPages(tmp_output_pdf) as cut_plane_pdf:
+                    for fig in cut_plane_figure_list:
+                        cut_plane_pdf.savefig(fig)
+        finally:
+            for fig in cut_plane_figure_list:
+                plt.close(fig)
         cutplane_output_file = os.path.join(self.path_test_output, "cut_plane_output.json")
         cut_plane_output_json.pop("figures")
         cut_plane_output_json["cut_leaves"] = cut_plane_output_json["cut_leaves"].tolist()
@@ -78,7 +86,7 @@ class NeuroM_MorphoCheck(sciunit.Test):
         def convert(o):
             if isinstance(o, numpy.int64): return int(o)
             raise TypeError
-        with open(cutplane_output_file, "w") as outfile:
+        with atomic_open(cutplane_output_file, "w") as outfile:
             json.dump(cut_plane_output_json, outfile, indent=4, default=convert)
 
         self.figures.append(morhpcheck_output_file)
@@ -1,8 +1,9 @@
 import sciunit
-import sciunit.scores as sci_scores
 import morphounit.scores as mph_scores
 # import morphounit.capabilities as mph_cap
-import morphounit.plots as mph_plots
+import morphounit.units as mph_units
+from morphounit.feature_matrix import FeatureMatrix
+from morphounit.artifacts import unique_run_dir, atomic_open, artifact_context, check_artifact_policy, render_plot, LazyArtifacts
 
 import os
 import copy
@@ -11,24 +12,33 @@ import json
 import neurom as nm
 
 import numpy as np
-import quantities
+import functools
+
+# sciunit.ObservationError, as raised by the other tests (recent sciunit versions only define it in sciunit.errors)
+_ObservationError = getattr(sciunit, 'ObservationError', None) or sciunit.errors.ObservationError
 
 
 class NeuroM_MorphStats_Test(sciunit.Test):
     """Tests a set of cell's morphological features"""
     score_type = mph_scores.CombineZScores
+    json_lines = False  # If True, per-cell predictions and scores are saved in single JSON Lines files
+    debug_dump = False  # If True, NeuroM configurations and model prediction are also saved as JSON files
+    results_table_format = 'tsv'  # Format of the table with all results: 'tsv' or 'csv'
+    results_txt_tables = False  # If True, human-readable results tables are also saved, one text file per cell
+    score_bars_report = False  # If True, per-cell score bar-plots are saved as the pages of a single PDF file
+    score_bars_dpi = 600  # Resolution of the score bar-plots...
+    score_bars_rasterized = False  # ... and whether their bars are drawn as images (lighter files, with a low dpi)
 
-    def __init__(self, observation=None, name="NeuroM_MorphStats_Test", base_directory=None):
+    def __init__(self, observation=None, name="NeuroM_MorphStats_Test", base_directory=None,
+                 artifact_policy='full', artifact_writer=None):
 
         self.description = "Tests a set of cell's morpho-features in a digitally reconstructed neuron"
         # require_capabilities = (mph_cap.ProvidesMorphFeatureInfo,)
 
         if not base_directory:
             base_directory = "."
-        self.path_test_output = base_directory
-        # create output directory
-        if not os.path.exists(self.path_test_output):
-            os.makedirs(self.path_test_output)
+        # create output directory, unique to this run
+        self.path_test_output = unique_run_dir(base_directory)
 
         # Checks raw observation data compliance with NeuroM's nomenclature
         self.check_observation(observation)
@@ -36,66 +46,56 @@ class NeuroM_MorphStats_Test(sciunit.Test):
 
         json.dumps(observation, sort_keys=True, indent=3)
 
-        self.figures = []
+        # Artifacts created by 'compute_score': none, only the data summaries (JSON files and text table),
+        # or also the figures. Their rendering is deferred until score.related_data["figures"] is accessed
+        self.artifact_policy = check_artifact_policy(artifact_policy)
+        # Optional morphounit.artifacts.ArtifactWriter, to render them in background processes instead
+        self.artifact_writer = artifact_writer
+        self.figures = LazyArtifacts()
+
         observation = self.format_data(observation)
         sciunit.Test.__init__(self, observation, name)
 
     # ----------------------------------------------------------------------
 
     def check_observation(self, observation):
-        """Checks raw observation file compliance with NeuroM's ('fst' module) nomenclature"""
-
-        # Cell parts available
-        neuron_parts_avail = [neurite_type.name for neurite_type in nm.NEURITE_TYPES[1:]]
-        neuron_parts_avail.append('neuron')
-
-        # Cell features available
-        cell_feats_avail = nm.fst.NEURONFEATURES.keys()
-
-        # Neurite features available
-        neurite_feats_avail = list(nm.fst.NEURITEFEATURES.keys())
-        neurite_feats_extra = ['neurite_field_diameter', 'neurite_largest_extent', 'neurite_shortest_extent',
-                               'neurite_X_extent', 'neurite_Y_extent', 'neurite_Z_extent']
-        neurite_feats_avail.extend(neurite_feats_extra)
-
-        # Statistical modes available
-        stat_modes = ['min', 'max', 'median', 'mean', 'total', 'std']
+        """Checks raw observation file compliance with NeuroM's ('fst' module) nomenclature.
+        All violations found are reported together, in a single sciunit ObservationError"""
 
         # morph_stats's nomenclature constraints to specify observation files
+        schema = observation_schema()
         """
-        self.neuroM_morph_stats_doc(neuron_parts_avail,
-                                    cell_feats_avail, neurite_feats_avail, neurite_feats_extra,
-                                    stat_modes)
+        self.neuroM_morph_stats_doc(schema.neuron_parts,
+                                    schema.cell_feats, schema.neurite_feats | schema.neurite_feats_extra,
+                                    schema.neurite_feats_extra, schema.stat_modes)
         """
 
-        # print "Checking observation file compliance with NeuroM's ('fst' module) nomenclature..."
+        errors = list()
         for dict1 in observation.values():  # Dict. with cell's part-features dictionary pairs for each cell
-            for key2, dict2 in list(dict1.items()):  # Dict. with feature name-value pairs for each cell part:
+            for key2, dict2 in dict1.items():  # Dict. with feature name-value pairs for each cell part:
                                                 #  neuron, apical_dendrite, basal_dendrite or axon
-                assert (key2 in neuron_parts_avail), \
-                    f"{key2} is not permitted for neuron parts. Please, use one in the following \
-                    list:\n {neuron_parts_avail}"
+                if key2 not in schema.neuron_parts:
+                    errors.append(f"{key2} is not permitted for neuron parts. Please, use one in the following "
+                                  f"list:\n {sorted(schema.neuron_parts)}")
+                    continue
 
                 for key3 in dict2.keys():
-                    feat_name, stat_mode = key3.split('_', 1)[1], key3.split('_', 1)[0]
-                    if key2 == 'neuron':
+                    feat_kind, feat_name, stat_mode = schema.feature_kind(key2, key3)
+                    if feat_kind == 'neuron' and feat_name not in schema.cell_feats:
                         # Checking the NeuroM features for the cell
-                        assert (feat_name in cell_feats_avail), \
-                            f"{feat_name} is not permitted for cells. Please, use one in the following \
-                            list:\n {sorted(cell_feats_avail)}"
-                        # Checking the statistical mode for the cell features
-                        assert (stat_mode in stat_modes), \
-                            f"{stat_mode} is not permitted for statistical modes. Please, use one in \
-                            the following list:\n {stat_modes}"
-                    elif feat_name in nm.fst.NEURITEFEATURES.keys():
-                        assert (stat_mode in stat_modes), \
-                            f"{stat_mode} is not permitted for statistical modes. Please, use one in \
-                            the following \list:\n {stat_modes}"
-                    else:
+                        errors.append(f"{feat_name} is not permitted for cells. Please, use one in the following "
+                                      f"list:\n {sorted(schema.cell_feats)}")
+                    if feat_kind in ('neuron', 'neurite') and stat_mode not in schema.stat_modes:
+                        # Checking the statistical mode for the cell and neurite features
+                        errors.append(f"{stat_mode} is not permitted for statistical modes. Please, use one in "
+                                      f"the following list:\n {sorted(schema.stat_modes)}")
+                    if feat_kind == 'extra' and key3 not in schema.neurite_feats_extra:
                         # Checking the extra-NeuroM features for Neurites, if any
-                        assert (key3 in neurite_feats_extra), \
-                            f"{key3} is not permitted for neurites. Please, use one in the following \
-                            list:\n {sorted(neurite_feats_avail)}"
+                        errors.append(f"{key3} is not permitted for neurites. Please, use one in the following "
+                                      f"list:\n {sorted(schema.neurite_feats | schema.neurite_feats_extra)}")
+
+        if errors:
+            raise _ObservationError("\n".join(errors))
 
     # ----------------------------------------------------------------------
 
@@ -148,56 +148,35 @@ class NeuroM_MorphStats_Test(sciunit.Test):
         ... }
 
         It splits the values of mean, std and value to numeric quantities
-        and their units (via quantities package)
+        and their units (via quantities package), returned as a morphounit.units.QuantityTable:
+        a float array with a row per (cell kind or cell ID, cell part, feature name) path
+        and a column per field ('mean' and 'std', or 'value'), plus the units of each feature
         """
-        dim_non = ['order', 'number', 'asymmetry', 'rate']
-        dim_um = ['radii', 'length', 'distance', 'extent']
-        dim_umSq = ['area']
-        dim_umCb = ['volume']
-        dim_deg = ['angle']
-        for dict1 in data.values():  # Dict. with cell's part-features dictionary pairs for each cell
-            for dict2 in dict1.values():  # Dict. with feature name-value pairs for each cell part:
-                                            # neuron, apical_dendrite, basal_dendrite or axon
-                for dict3 in dict2.values():  # Dict. with 'value', 'mean' and 'std' values
-                    for key, val in dict3.items():
-                        quantity_parts = val.split()
-                        number, units_str = float(quantity_parts[0]), " ".join(quantity_parts[1:])
-                        try:
-                            if any(sub_str in key for sub_str in dim_um):
-                                assert (units_str == quantities.um | units_str == quantities.mm), \
-                                    sciunit.Error("Values not in appropriate format. Required units: mm or um")
-                            elif any(sub_str in key for sub_str in dim_non):
-                                assert (units_str == quantities.dimensionless), \
-                                    sciunit.Error("Values not in appropriate format. Required units: ",
-                                                  quantities.dimensionless)
-                        finally:
-                            dict3[key] = quantities.Quantity(number, units_str)
-
-        return data
+        # Values are parsed all at once (memoizing units), checking the units of
+        # lengths (mm or um) and dimensionless features (e.g. orders, numbers)
+        return mph_units.QuantityTable.from_tree(data, depth=3, check=mph_units.check_feature_units)
 
     # ----------------------------------------------------------------------
 
     def validate_observation(self, observation):
 
-        # Checking format of the observation data
-        for dict1 in observation.values():  # Dict. with cell's part-features dictionary pairs for each cell
-            for dict2 in dict1.values():  # Dict. with feature name-value pairs for each cell part:
-                                            # neuron, apical_dendrite, basal_dendrite or axon
-                for dict3 in dict2.values():  # Dict. with 'value' or 'mean' and 'std' values
-                    for val in dict3.values():
-                        assert type(val) is quantities.Quantity, \
-                            sciunit.Error(("Observation must be of the form "
-                                           "{'mean': 'XX units_str','std': 'YY units_str'}"))
+        # Checking format of the observation data: every feature has a mean and a std
+        assert isinstance(observation, mph_units.QuantityTable) and \
+            {'mean', 'std'} <= set(observation.fields) and \
+            observation.present[:, [observation.fields.index('mean'), observation.fields.index('std')]].all(), \
+            sciunit.Error(("Observation must be of the form "
+                           "{'mean': 'XX units_str','std': 'YY units_str'}"))
 
     # ----------------------------------------------------------------------
 
-    def set_morph_stats_config_file(self):
-        """ Creates two configuration files, following the structure of a
+    def morph_stats_config(self):
+        """ Creates two configuration dictionaries, following the structure of a
         raw observation JSON file (previously to SciUnit formatting):
         - One for morph_stats features to be computed, and
         a second one for non-morph_stats features found in the observation file."""
 
         observation = self.raw_observation
+        schema = observation_schema()
 
         neurite_type_list = list()
         feat_name_stat_mode_neurite_dict = dict()
@@ -212,16 +191,16 @@ class NeuroM_MorphStats_Test(sciunit.Test):
                     neurite_type_list.append(key2.upper())
                     neurite_feats_extra_dict.update({key2: []})
                 for key3 in dict2.keys():
-                    feat_name, stat_mode = key3.split('_', 1)[1], key3.split('_', 1)[0]
+                    feat_kind, feat_name, stat_mode = schema.feature_kind(key2, key3)
 
-                    if key2 == 'neuron':
+                    if feat_kind == 'neuron':
                         if feat_name in feat_name_stat_mode_cell_dict and \
                                 stat_mode not in feat_name_stat_mode_cell_dict[feat_name]:
                             feat_name_stat_mode_cell_dict[feat_name].append(stat_mode)
                         else:
                             feat_name_stat_mode_cell_dict.update({feat_name: [stat_mode]})
 
-                    elif feat_name in nm.fst.NEURITEFEATURES.keys():
+                    elif feat_kind == 'neurite':
                         if feat_name in feat_name_stat_mode_neurite_dict and \
                                 stat_mode not in feat_name_stat_mode_neurite_dict[feat_name]:
                             feat_name_stat_mode_neurite_dict[feat_name].append(stat_mode)
@@ -238,6 +217,20 @@ class NeuroM_MorphStats_Test(sciunit.Test):
         # print('Configuration file for morph_stats was completed. \n', \
         #  json.dumps(morph_stats_config_dict, sort_keys=True, indent=3))
 
+        # Morphometrics of non-morph_stats features to be computed
+        neurite_feats_extra_dict = {key: value for key, value in neurite_feats_extra_dict.items() if value}
+
+        return morph_stats_config_dict, neurite_feats_extra_dict
+
+    # ----------------------------------------------------------------------
+
+    def set_morph_stats_config_file(self):
+        """ Creates two configuration files (see 'morph_stats_config'), in JSON format:
+        - One for morph_stats features to be computed, and
+        a second one for non-morph_stats features found in the observation file (only if any)."""
+
+        morph_stats_config_dict, neurite_feats_extra_dict = self.morph_stats_config()
+
         obs_dir = self.path_test_output
         # obs_dir = os.path.dirname(observation_path)
         # obs_file_name = os.path.basename(observation_path)
@@ -245,14 +238,9 @@ class NeuroM_MorphStats_Test(sciunit.Test):
         # Saving NeuroM's morph_stats configuration file in JSON format
         # morph_stats_conf_file = os.path.splitext(obs_file_name)[0] + '_config.json'
         morph_stats_config_path = os.path.join(obs_dir, 'morph_stats_config.json')
-        with open(morph_stats_config_path, 'w') as fp:
+        with atomic_open(morph_stats_config_path, 'w') as fp:
             json.dump(morph_stats_config_dict, fp, sort_keys=True, indent=3)
 
-        # Morphometrics of non-morph_stats features to be computed
-        for key, value in neurite_feats_extra_dict.items():
-            if not value:
-                del neurite_feats_extra_dict[key]
-
         # neuroM_extra_config_file = os.path.splitext(obs_file_name)[0] + '_extra.json'
         neuroM_extra_config_path = os.path.join(obs_dir, 'neuroM_extra_config.json')
         # Remove existing file, if any
@@ -263,7 +251,7 @@ class NeuroM_MorphStats_Test(sciunit.Test):
             # print('The following morphometrics will be extracted separately and added to the model prediction: \n', \
             # json.dumps(neurite_feats_extra_dict, sort_keys=True, indent=3))
             # Saving NeuroM's configuration extra-file in JSON format
-            with open(neuroM_extra_config_path, 'w') as fp:
+            with atomic_open(neuroM_extra_config_path, 'w') as fp:
                 json.dump(neurite_feats_extra_dict, fp, sort_keys=True, indent=3)
 
         return morph_stats_config_path, neuroM_extra_config_path
@@ -271,34 +259,45 @@ class NeuroM_MorphStats_Test(sciunit.Test):
     # ----------------------------------------------------------------------
 
     def raw_model_prediction(self, model):
-        """ Creates a model prediction file containing the morphometrics \
-        specified in configuration files for NeuroM """
+        """ Creates a model prediction containing the morphometrics specified in configuration
+        dictionaries for NeuroM. Configurations and prediction are passed to the model in memory;
+        if 'debug_dump' is set, they are also saved as JSON files (configuration files in the
+        Test's output directory, and prediction in the model's prediction file) """
 
-        # Creates a configuration file for morph_stats, following the structure of a raw observation data
-        morph_stats_config_path, neuroM_extra_config_path = self.set_morph_stats_config_file()
+        # Creates the configurations for morph_stats, following the structure of a raw observation data
+        morph_stats_config_dict, neuroM_extra_config_dict = self.morph_stats_config()
+        if self.debug_dump:
+            self.set_morph_stats_config_file()
 
-        # Creating the prediction file with morph_stats
+        # Creating the prediction with morph_stats
         self.morp_path = model.morph_path
 
-        mod_prediction_temp = model.set_morph_feature_info(morph_stats_config_path=morph_stats_config_path)
-        os.remove(morph_stats_config_path)
+        mod_prediction_temp = model.set_morph_feature_info(morph_stats_config=morph_stats_config_dict)
 
-        # Deleting some neurite's morphometrics added by morph_stats, but not present in the observation file
-        mod_prediction = copy.deepcopy(mod_prediction_temp)
+        # Leaving out some neurite's morphometrics added by morph_stats, but not present in the observation file
         cell_t = list(self.raw_observation.keys())[0]  # Cell type
-        for cell_ID, cell_dict in list(mod_prediction_temp.items()):
-            for cell_part, cell_part_dict in list(cell_dict.items()):
-                for feat_name_stat_mode in cell_part_dict:
-                    if cell_part != 'neuron' and feat_name_stat_mode not in self.raw_observation[cell_t][cell_part]:
-                        del mod_prediction[cell_ID][cell_part][feat_name_stat_mode]
-
-        with open(model.output_pred_file, 'w') as fp:
-            json.dump(mod_prediction, fp, sort_keys=True, indent=3)
+        obs_dict = self.raw_observation[cell_t]
+        mod_prediction = dict()
+        for cell_ID, cell_dict in mod_prediction_temp.items():
+            mod_prediction[cell_ID] = dict()
+            for cell_part, cell_part_dict in cell_dict.items():
+                if cell_part == 'neuron':
+                    mod_prediction[cell_ID][cell_part] = dict(cell_part_dict)
+                else:
+                    mod_prediction[cell_ID][cell_part] = \
+                        {feat_name_stat_mode: value for feat_name_stat_mode, value in cell_part_dict.items()
+                         if feat_name_stat_mode in obs_dict[cell_part]}
 
-        mod_prediction_all = model.complete_morph_feature_info(neuroM_extra_config_path=neuroM_extra_config_path)
-        os.remove(neuroM_extra_config_path)
+        mod_prediction_all = model.complete_morph_feature_info(mod_prediction=mod_prediction,
+                                                               neuroM_extra_config=neuroM_extra_config_dict)
 
-        os.remove(model.output_pred_file)
+        if self.debug_dump:
+            # create the model's output directory, only needed for this file
+            pred_dir = os.path.dirname(model.output_pred_file)
+            if not os.path.exists(pred_dir):
+                os.makedirs(pred_dir)
+            with atomic_open(model.output_pred_file, 'w') as fp:
+                json.dump(mod_prediction_all, fp, sort_keys=True, indent=3)
 
         return mod_prediction_all
 
@@ -319,33 +318,36 @@ class NeuroM_MorphStats_Test(sciunit.Test):
 
     # ----------------------------------------------------------------------
 
-    def compute_score(self, observation, prediction, verbose=True):
-        """Implementation of sciunit.Test.score_prediction"""
+    def compute_zscores(self, observation, prediction):
+        """Computes the Z-scores of all cells and features at once: predicted values are arranged
+        in a (cells x features) FeatureMatrix ('prediction_matrix'), expressed in the units of the observation,
+        and broadcast against the observation's means and standard deviations (columns of its QuantityTable).
+        Sets the Z-scores, as a FeatureMatrix of the same shape ('score_matrix'), the per-feature and per-cell
+        scores ('score_feat_dict' and 'score_cell_dict', the latter being the mean |Z-score| of the cell),
+        and returns the overall score: the average of the cells' scores"""
 
-        self.observation = observation
-        self.prediction = prediction
+        # only features registered in observation data are tested (paths: cell type, cell part, feature name)
+        features = [path[1:] for path in observation.paths]
+        obs_mean = observation.column('mean')
+        obs_std = observation.column('std')
 
-        # Computing the scores
-        cell_t = list(observation.keys())[0]  # Cell type
+        self.prediction_matrix = prediction.matrix('value', features, units_strs=observation.units_strs)
+        cell_IDs = list(self.prediction_matrix.cell_ids)
 
-        score_cell_dict = dict.fromkeys([key0 for key0 in prediction.keys()], [])
-        obs_features = copy.deepcopy(list(observation.values()))[0]
+        z_scores = mph_scores.CombineZScores.compute_zscores(obs_mean, obs_std, self.prediction_matrix.values)
+        cell_scores = mph_scores.CombineZScores.compute_array(z_scores)
+        self.score_matrix = FeatureMatrix(z_scores, cell_IDs, self.prediction_matrix.cell_parts,
+                                          self.prediction_matrix.feat_names)
 
+        # Nested-dictionary views of the scores (for the JSON files and the score bar-plots)
         score_feat_dict = dict()
-        for key0 in prediction:  # cell_ID keys
-
-            score_feat_dict.update({key0: obs_features})
-            scores_cell_list = list()
-            for key1 in score_feat_dict[key0]:  # cell's part: neuron, axon, apical_dendrite or basal_dendrite
-                for key2 in score_feat_dict[key0][key1]:  # features names
+        score_cell_dict = dict()
+        for key0, z_row, cell_score in zip(cell_IDs, z_scores.tolist(), cell_scores.tolist()):
+            score_feat_dict[key0] = dict()
+            for (key1, key2), z_value in zip(features, z_row):
+                score_feat_dict[key0].setdefault(key1, dict())[key2] = {"score": z_value}
 
-                    score_feat_value = sci_scores.ZScore.compute(observation[cell_t][key1][key2],
-                                                                 prediction[key0][key1][key2]).score
-                    scores_cell_list.extend([score_feat_value])
-
-                    score_feat_dict[key0][key1][key2] = {"score": score_feat_value}
-
-            Mean_Zscore_dict = {"A mean |Z-score|": mph_scores.CombineZScores.compute(scores_cell_list).score}
+            Mean_Zscore_dict = {"A mean |Z-score|": cell_score}
             score_feat_dict[key0].update(Mean_Zscore_dict)
             score_cell_dict[key0] = Mean_Zscore_dict
 
@@ -353,35 +355,92 @@ class NeuroM_MorphStats_Test(sciunit.Test):
         self.score_feat_dict = score_feat_dict
 
         # Taking the average of the cell's scores as the overall score for the Test
-        mean_score = np.mean([dict1["A mean |Z-score|"] for dict1 in score_cell_dict.values()])
-        self.score = mph_scores.CombineZScores(mean_score)
-        self.score.description = "A mean |Z-score|"
+        score = mph_scores.CombineZScores(float(np.mean(cell_scores)))
+        score.description = "A mean |Z-score|"
+        return score
+
+    # ----------------------------------------------------------------------
+
+    def compute_score(self, observation, prediction, verbose=True):
+        """Implementation of sciunit.Test.score_prediction"""
+
+        self.observation = observation
+        self.prediction = prediction
+
+        # Computing the scores
+        self.score = self.compute_zscores(observation, prediction)
 
         # ---------------------- Saving relevant results ----------------------
+        self.figures = LazyArtifacts(writer=self.artifact_writer)
+        self.defer_artifacts()
+
+        return self.score
+
+    def defer_artifacts(self):
+        """Schedules the output files allowed by the artifact policy, on a snapshot of the Test's results"""
+
+        if self.artifact_policy == 'none':
+            return
+        context = artifact_context(self)
+
         # Saving json file with model predictions
-        json_pred_file = mph_plots.jsonFile_MorphStats(testObj=self, dictData=self.prediction_txt,
-                                                       prefix_name="prediction_summary_")
-        json_pred_files = json_pred_file.create()
-        self.figures.extend(json_pred_files)
+        self.figures.defer(render_plot, "jsonFile_MorphStats", testObj=context, dictData=self.prediction_txt,
+                           prefix_name="prediction_summary_", json_lines=self.json_lines)
 
         # Saving json file with scores
-        json_scores_file = mph_plots.jsonFile_MorphStats(testObj=self, dictData=self.score_feat_dict,
-                                                         prefix_name="scores_summary_")
-        json_scores_files = json_scores_file.create()
-        self.figures.extend(json_scores_files)
-
-        # Saving table with results
-        txt_table = mph_plots.TxtTable_MorphStats(testObj=self)
-        table_files = txt_table.create()
-        self.figures.extend(table_files)
+        self.figures.defer(render_plot, "jsonFile_MorphStats", testObj=context, dictData=self.score_feat_dict,
+                           prefix_name="scores_summary_", json_lines=self.json_lines)
 
-        # Saving figure with scores bar-plot
-        barplot_figure = mph_plots.ScoresBars_MorphStats(testObj=self)
-        barplot_files = barplot_figure.create()
-        self.figures.extend(barplot_files)
+        # Saving table with results, and the optional human-readable tables
+        self.figures.defer(render_plot, "ResultsTable_MorphStats", testObj=context,
+                           file_format=self.results_table_format)
+        if self.results_txt_tables:
+            self.figures.defer(render_plot, "TxtTable_MorphStats", testObj=context)
 
-        return self.score
+        if self.artifact_policy == 'full':
+            # Saving figure with scores bar-plot
+            self.figures.defer(render_plot, "ScoresBars_MorphStats", testObj=context, report=self.score_bars_report,
+                               dpi=self.score_bars_dpi, rasterized=self.score_bars_rasterized)
 
     def bind_score(self, score, model, observation, prediction):
         score.related_data["figures"] = self.figures
         return score
+
+
+class ObservationSchema:
+    """NeuroM's ('fst' module) nomenclature for observation files: cell parts, cell and neurite
+    features and statistical modes available, as sets"""
+
+    def __init__(self):
+        # Cell parts available
+        self.neuron_parts = frozenset([neurite_type.name for neurite_type in nm.NEURITE_TYPES[1:]] + ['neuron'])
+
+        # Cell features available
+        self.cell_feats = frozenset(nm.fst.NEURONFEATURES.keys())
+
+        # Neurite features available, computed by NeuroM or separately (extra-NeuroM features)
+        self.neurite_feats = frozenset(nm.fst.NEURITEFEATURES.keys())
+        self.neurite_feats_extra = frozenset(['neurite_field_diameter', 'neurite_largest_extent',
+                                              'neurite_shortest_extent', 'neurite_X_extent',
+                                              'neurite_Y_extent', 'neurite_Z_extent'])
+
+        # Statistical modes available
+        self.stat_modes = frozenset(['min', 'max', 'median', 'mean', 'total', 'std'])
+
+    def feature_kind(self, cell_part, feat_name_stat_mode):
+        """Splits an observation's feature key (stats. mode + '_' + feature name) and tells how the feature
+        is computed: 'neuron' (NeuroM cell feature), 'neurite' (NeuroM neurite feature) or 'extra'.
+        Returns (feature kind, feature name, stats. mode)"""
+
+        stat_mode, _, feat_name = feat_name_stat_mode.partition('_')
+        if cell_part == 'neuron':
+            return 'neuron', feat_name, stat_mode
+        if feat_name in self.neurite_feats:
+            return 'neurite', feat_name, stat_mode
+        return 'extra', feat_name, stat_mode
+
+
+@functools.lru_cache(maxsize=None)
+def observation_schema():
+    """Observation schema, built once per process"""
+    return ObservationSchema()
@@ -1,8 +1,7 @@
 import sciunit
-import sciunit.scores as sci_scores
 import morphounit.scores as mph_scores
 # import morphounit.capabilities as mph_cap
-import morphounit.plots as mph_plots
+from morphounit.artifacts import artifact_context, render_plot, LazyArtifacts
 
 import os
 import copy
@@ -10,7 +9,6 @@ import json
 
 import neurom as nm
 
-import numpy as np
 import quantities
 
 from .test_NeuroM_MorphStats import NeuroM_MorphStats_Test
@@ -19,14 +17,28 @@ class NeuroM_MorphStats_pop_Test(NeuroM_MorphStats_Test):
     """Tests a set of cell's morphological features in a neuronal population"""
     score_type = mph_scores.CombineZScores
 
-    def __init__(self, observation=None, name="NeuroM_MorphStats_pop_Test", base_directory=None):
+    def __init__(self, observation=None, name="NeuroM_MorphStats_pop_Test", base_directory=None,
+                 artifact_policy='full', artifact_writer=None):
 
-        super().__init__(observation=observation, name=name, base_directory=base_directory)
+        super().__init__(observation=observation, name=name, base_directory=base_directory,
+                         artifact_policy=artifact_policy, artifact_writer=artifact_writer)
         self.description = "Tests a set of cell's morpho-features in a population of digitally reconstructed neurons"
         # require_capabilities = (mph_cap.ProvidesMorphFeatureInfo,)
 
     # ----------------------------------------------------------------------
 
+    @property
+    def prediction_cells_dict(self):
+        """Per-cell raw data, as {population_name: {cell_part: {feat_name: [X_cell1, X_cell2, ...]}}}
+        (a view of 'prediction_cells_matrix', kept for compatibility)"""
+
+        pop_matrix = getattr(self, 'prediction_cells_matrix', None)
+        if pop_matrix is None:
+            return None
+        return {pop_matrix.name: pop_matrix.to_columns()}
+
+    # ----------------------------------------------------------------------
+
     def generate_prediction(self, model, verbose=False):
         """Implementation of sciunit.Test.generate_prediction"""
 
@@ -36,13 +48,14 @@ class NeuroM_MorphStats_pop_Test(NeuroM_MorphStats_Test):
 
         # Collecting raw data from all cells and computing the
         # corresponding the mean morphometrics describing the whole population
-        pop_cells_prediction, pop_avg_prediction = model.avg_prediction(mod_data=mod_prediction_all)
+        pop_cells_prediction, pop_avg_prediction = model.avg_prediction(mod_data=mod_prediction_all.items())
 
         mod_prediction = model.pre_formatting(mod_data=pop_avg_prediction)
         self.prediction_pop_dict = copy.deepcopy(mod_prediction)
         prediction = self.format_data(mod_prediction)
 
-        self.prediction_cells_dict = copy.deepcopy(pop_cells_prediction)
+        # Per-cell raw data, as a FeatureMatrix (None, if the model does not keep it)
+        self.prediction_cells_matrix = pop_cells_prediction
 
         return prediction
 
@@ -55,34 +68,7 @@ class NeuroM_MorphStats_pop_Test(NeuroM_MorphStats_Test):
         self.prediction = prediction
 
         # Computing the scores
-        cell_t = list(observation.keys())[0]  # Cell type
-
-        score_cell_dict = dict.fromkeys([key0 for key0 in prediction.keys()], [])
-        obs_features = copy.deepcopy(list(observation.values()))[0]  # only features registered in observation data are tested
-        score_feat_dict = dict()
-        for key0 in prediction:  # cell_ID keys
-
-            score_feat_dict.update({key0: obs_features})
-            scores_cell_list = list()
-            for key1 in score_feat_dict[key0]:  # cell's part: soma, axon, apical_dendrite or basal_dendrite
-                for key2 in score_feat_dict[key0][key1]:  # features names
-                    score_feat_value = sci_scores.ZScore.compute(observation[cell_t][key1][key2],
-                                                                 prediction[key0][key1][key2]).score
-                    scores_cell_list.extend([score_feat_value])
-
-                    score_feat_dict[key0][key1][key2] = {"score": score_feat_value}
-
-            Mean_Zscore_dict = {"A mean |Z-score|": mph_scores.CombineZScores.compute(scores_cell_list).score}
-            score_feat_dict[key0].update(Mean_Zscore_dict)
-            score_cell_dict[key0] = Mean_Zscore_dict
-
-        self.score_cell_dict = score_cell_dict
-        self.score_feat_dict = score_feat_dict
-
-        # Taking the average of the cell's scores as the overall score for the Test
-        mean_score = np.mean([dict1["A mean |Z-score|"] for dict1 in score_cell_dict.values()])
-        self.score = mph_scores.CombineZScores(mean_score)
-        self.score.description = "A mean |Z-score|"
+        self.score = self.compute_zscores(observation, prediction)
 
         # ---------------------- Saving relevant results ----------------------
         # create output directory
@@ -91,41 +77,47 @@ class NeuroM_MorphStats_pop_Test(NeuroM_MorphStats_Test):
         if not os.path.exists(self.path_test_output):
             os.makedirs(self.path_test_output)
         """
+        self.figures = LazyArtifacts(writer=self.artifact_writer)
+        self.defer_artifacts()
+
+        return self.score
+
+    def defer_artifacts(self):
+        """Schedules the output files allowed by the artifact policy, on a snapshot of the Test's results"""
+
+        if self.artifact_policy == 'none':
+            return
+        context = artifact_context(self)
+
         # Saving json file with all cells predictions
-        json_pred_file = mph_plots.jsonFile_MorphStats(testObj=self, dictData=self.prediction_cells_dict,
-                                                       prefix_name="prediction_summary_")
-        json_pred_files = json_pred_file.create()
-        self.figures.extend(json_pred_files)
+        if self.prediction_cells_matrix is not None:
+            self.figures.defer(render_plot, "jsonFile_MorphStats", testObj=context,
+                               dictData=self.prediction_cells_dict, prefix_name="prediction_summary_",
+                               json_lines=self.json_lines)
 
         # Saving json file with population's prediction
-        json_pred_file = mph_plots.jsonFile_MorphStats(testObj=self, dictData=self.prediction_pop_dict,
-                                                       prefix_name="prediction_summary_")
-        json_pred_files = json_pred_file.create()
-        self.figures.extend(json_pred_files)
+        self.figures.defer(render_plot, "jsonFile_MorphStats", testObj=context, dictData=self.prediction_pop_dict,
+                           prefix_name="prediction_summary_")
 
         # Saving json file with population's scores
-        json_scores_file = mph_plots.jsonFile_MorphStats(testObj=self, dictData=self.score_feat_dict,
-                                                         prefix_name="scores_summary_")
-        json_scores_files = json_scores_file.create()
-        self.figures.extend(json_scores_files)
-
-        # Saving table with population's results
-        txt_table = mph_plots.TxtTable_MorphStats(testObj=self)
-        table_files = txt_table.create()
-        self.figures.extend(table_files)
-
-        # Saving figure with with population's in the form of bar-plot
-        barplot_figure = mph_plots.ScoresBars_MorphStats(testObj=self)
-        barplot_files = barplot_figure.create()
-        self.figures.extend(barplot_files)
-
-        # Saving figures with statistics of the cells' morpho-features,
-        # in the form of correlation, countour and distribution plots
-        statsplot_figure = mph_plots.FeatsPop_MorphStats(testObj=self)
-        statsplot_files = statsplot_figure.create()
-        self.figures.extend(statsplot_files)
-
-        return self.score
+        self.figures.defer(render_plot, "jsonFile_MorphStats", testObj=context, dictData=self.score_feat_dict,
+                           prefix_name="scores_summary_")
+
+        # Saving table with population's results, and the optional human-readable tables
+        self.figures.defer(render_plot, "ResultsTable_MorphStats", testObj=context,
+                           file_format=self.results_table_format)
+        if self.results_txt_tables:
+            self.figures.defer(render_plot, "TxtTable_MorphStats", testObj=context)
+
+        if self.artifact_policy == 'full':
+            # Saving figure with with population's in the form of bar-plot
+            self.figures.defer(render_plot, "ScoresBars_MorphStats", testObj=context, report=self.score_bars_report,
+                               dpi=self.score_bars_dpi, rasterized=self.score_bars_rasterized)
+
+            # Saving figures with statistics of the cells' morpho-features,
+            # in the form of correlation, countour and distribution plots
+            if self.prediction_cells_matrix is not None:
+                self.figures.defer(render_plot, "FeatsPop_MorphStats", testObj=context)
 
     def bind_score(self, score, model, observation, prediction):
         score.related_data["figures"] = self.figures
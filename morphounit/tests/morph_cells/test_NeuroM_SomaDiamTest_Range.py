@@ -3,6 +3,8 @@ import sciunit.scores
 import morphounit.scores
 import morphounit.capabilities as cap
 import morphounit.plots as plots
+import morphounit.units
+from morphounit.artifacts import unique_run_dir
 
 import quantities
 import os
@@ -48,17 +50,8 @@ class NeuroM_SomaDiamTest_Range(sciunit.Test):
         and splits the values of min, max and value to numeric quantities
         and their units (via quantities package).
         """
-        for key,val in data["diameter"].items():
-            try:
-                quantity_parts = val.split(" ")
-                number = float(quantity_parts[0])
-                units_str = " ".join(quantity_parts[1:])
-                assert (units_str == self.units.symbol)
-                data["diameter"][key] = quantities.Quantity(number, self.units)
-            except AssertionError:
-                raise sciunit.Error("Values not in appropriate format. Required units: ", self.units.symbol)
-            except:
-                raise sciunit.Error("Values not in appropriate format.")
+        data["diameter"] = morphounit.units.QuantityTable.from_tree(data["diameter"], depth=0,
+                                                                    units=self.units).to_tree()
         return data
 
     #----------------------------------------------------------------------
@@ -92,9 +85,8 @@ class NeuroM_SomaDiamTest_Range(sciunit.Test):
         self.score.description = "score is 0.0 if within range; otherwise difference"
 
         # create output directory
-        self.path_test_output = self.directory_output + 'soma_diameter_range/' + self.model_name + '/'
-        if not os.path.exists(self.path_test_output):
-            os.makedirs(self.path_test_output)
+        # (a new directory for each run, so that concurrent runs do not overwrite each other's files)
+        self.path_test_output = os.path.join(unique_run_dir(self.directory_output, 'soma_diameter_range', self.model_name), '')
 
         self.observation = observation
         self.prediction = prediction
@@ -2,6 +2,8 @@ import sciunit
 import sciunit.scores
 import morphounit.capabilities as cap
 import morphounit.plots as plots
+import morphounit.units
+from morphounit.artifacts import unique_run_dir
 
 import quantities
 import os
@@ -40,17 +42,8 @@ class CellDensityTest(sciunit.Test):
         It splits the values of mean, std, value to numeric quantities
         and their units (via quantities package).
         """
-        for key,val in data["density"].items():
-            try:
-                quantity_parts = val.split(" ")
-                number = float(quantity_parts[0])
-                units_str = " ".join(quantity_parts[1:])
-                assert (units_str == self.units.symbol)
-                data["density"][key] = quantities.Quantity(number, self.units)
-            except AssertionError:
-                raise sciunit.Error("Values not in appropriate format. Required units: ", self.units.symbol)
-            except:
-                raise sciunit.Error("Values not in appropriate format.")
+        data["density"] = morphounit.units.QuantityTable.from_tree(data["density"], depth=0,
+                                                                   units=self.units).to_tree()
         return data
 
     #----------------------------------------------------------------------
@@ -83,9 +76,8 @@ class CellDensityTest(sciunit.Test):
         self.score.description = "A simple Z-score"
 
         # create output directory
-        self.path_test_output = self.directory_output + 'cell_density/' + self.model_name + '/'
-        if not os.path.exists(self.path_test_output):
-            os.makedirs(self.path_test_output)
+        # (a new directory for each run, so that concurrent runs do not overwrite each other's files)
+        self.path_test_output = os.path.join(unique_run_dir(self.directory_output, 'cell_density', self.model_name), '')
 
         self.observation = observation
         self.prediction = prediction
@@ -3,6 +3,8 @@ import sciunit.scores
 import morphounit.scores
 import morphounit.capabilities as cap
 import morphounit.plots as plots
+import morphounit.units
+from morphounit.artifacts import unique_run_dir
 
 import quantities
 import os
@@ -50,17 +52,8 @@ class LayerHeightTest(sciunit.Test):
         and their units (via quantities package).
         """
         for key0 in data.keys():
-            for key, val in data[key0]["height"].items():
-                try:
-                    quantity_parts = val.split(" ")
-                    number = float(quantity_parts[0])
-                    units_str = " ".join(quantity_parts[1:])
-                    assert (units_str == self.units.symbol)
-                    data[key0]["height"][key] = quantities.Quantity(number, self.units)
-                except AssertionError:
-                    raise sciunit.Error("Values not in appropriate format. Required units: ", self.units.symbol)
-                except:
-                    raise sciunit.Error("Values not in appropriate format.")
+            data[key0]["height"] = morphounit.units.QuantityTable.from_tree(data[key0]["height"], depth=0,
+                                                                            units=self.units).to_tree()
         return data
 
     #----------------------------------------------------------------------
@@ -105,9 +98,8 @@ class LayerHeightTest(sciunit.Test):
         self.score.description = "Mean of absolute Z-scores"
 
         # create output directory
-        self.path_test_output = self.directory_output + 'layer_height/' + self.model_name + '/'
-        if not os.path.exists(self.path_test_output):
-            os.makedirs(self.path_test_output)
+        # (a new directory for each run, so that concurrent runs do not overwrite each other's files)
+        self.path_test_output = os.path.join(unique_run_dir(self.directory_output, 'layer_height', self.model_name), '')
 
         self.observation = observation
         self.prediction = prediction
@@ -0,0 +1,218 @@
+"""Shared parsing of the 'X units_str' values found in observation and prediction data (via quantities package)"""
+
+import functools
+
+import numpy as np
+import quantities
+import sciunit
+
+from morphounit.feature_matrix import FeatureMatrix
+
+
+# Unit category of the morpho-features, according to the keywords in their names (checked in this order)
+FEATURE_UNIT_CATEGORIES = (('length', ('radii', 'length', 'distance', 'extent')),
+                           ('dimensionless', ('order', 'number', 'asymmetry', 'rate')),
+                           ('area', ('area',)),
+                           ('volume', ('volume',)),
+                           ('angle', ('angle',)))
+
+
+@functools.lru_cache(maxsize=None)
+def parse_units(units_str):
+    """Units object for a units string, e.g. 'um' (an empty string stands for dimensionless)"""
+    return quantities.Quantity(1.0, units_str).units
+
+
+@functools.lru_cache(maxsize=None)
+def units_factor(from_units, to_units):
+    """Conversion factor between two units, given as strings"""
+    return float(quantities.Quantity(1.0, from_units).rescale(to_units).magnitude)
+
+
+@functools.lru_cache(maxsize=None)
+def unit_category(feat_name):
+    """Unit category of a morpho-feature ('length', 'dimensionless', ...), or None if unknown"""
+    for category, keywords in FEATURE_UNIT_CATEGORIES:
+        if any(sub_str in feat_name for sub_str in keywords):
+            return category
+    return None
+
+
+def split_quantity(value):
+    """Splits a value into its number and units string: 'X units_str' strings,
+    quantities' Quantity objects and plain numbers (dimensionless) are accepted"""
+
+    if isinstance(value, quantities.Quantity):
+        return float(value.magnitude), value.dimensionality.string
+    if isinstance(value, str):
+        quantity_parts = value.split()
+        return float(quantity_parts[0]), " ".join(quantity_parts[1:])
+    return float(value), ''
+
+
+def magnitude(value, units_str):
+    """Magnitude of a value (see 'split_quantity') expressed in the given units"""
+
+    number, value_units = split_quantity(value)
+    if value_units == units_str:
+        return number
+    return number * units_factor(value_units, units_str)
+
+
+def check_feature_units(path, units_str):
+    """Checks the units of a morpho-feature value, given the feature's path in the data tree
+    (its name being the last key): lengths must be given in um or mm, and counts, orders,
+    asymmetries and rates must be dimensionless"""
+
+    _check_feature_units(path[-1], units_str)
+
+
+@functools.lru_cache(maxsize=None)
+def _check_feature_units(feat_name, units_str):
+    # Only successful checks are memoized (errors are raised again every time)
+    category = unit_category(feat_name)
+    if category == 'length':
+        if parse_units(units_str).dimensionality.string not in ('um', 'mm'):
+            raise sciunit.Error("Values not in appropriate format. Required units: mm or um")
+    elif category == 'dimensionless':
+        if parse_units(units_str).dimensionality.string != 'dimensionless':
+            raise sciunit.Error("Values not in appropriate format. Required units: ", quantities.dimensionless)
+
+
+def _leaves(data, depth, path=()):
+    """Yields the (path, leaf dictionary) pairs found at the given depth of a data tree"""
+
+    if depth == 0:
+        yield path, data
+        return
+    for key, value in data.items():
+        yield from _leaves(value, depth - 1, path + (key,))
+
+
+class QuantityTable:
+    """
+    The values of a data tree as a float array: one row per feature (the path of keys
+    leading to a dictionary such as {'mean': 'X units_str', 'std': 'Y units_str'} or
+    {'value': 'X units_str'}), one column per field ('mean', 'std', 'value', ...),
+    with a single units tag per feature. Missing fields are NaN.
+    Values are read as arrays ('column', 'matrix'); Quantity objects are only built on request
+    ('quantity', 'to_tree').
+    """
+
+    def __init__(self, paths, fields, values, units_strs, units=None, present=None):
+        self.paths = paths
+        self.fields = fields
+        self.values = values
+        self.units_strs = units_strs
+        self.units = units  # Common units object of all features, if fixed
+        self.present = present if present is not None else ~np.isnan(values)  # Fields given for each feature
+        self._row_index = None
+
+    @classmethod
+    def from_tree(cls, data, depth, units=None, check=None):
+        """
+        Parses the values found at the given depth of the tree 'data'.
+        If 'units' is given, every value must be expressed in those units (compared by symbol);
+        otherwise, the fields of each feature are converted to the units of its first field.
+        'check', if given, is called with each feature's path and the units string of each value,
+        e.g. 'check_feature_units'. Values not in the appropriate format raise sciunit.Error
+        """
+
+        paths = list()
+        fields = dict()
+        rows = list()
+        units_strs = list()
+        for path, leaf in _leaves(data, depth):
+            row = dict()
+            path_units = None
+            for field, value in leaf.items():
+                try:
+                    number, units_str = split_quantity(value)
+                except (ValueError, TypeError, IndexError, AttributeError):
+                    raise sciunit.Error("Values not in appropriate format.")
+                if units is not None and units_str != units.symbol:
+                    raise sciunit.Error("Values not in appropriate format. Required units: ", units.symbol)
+                if check is not None:
+                    check(path, units_str)
+
+                if path_units is None:
+                    path_units = units_str
+                elif units_str != path_units:
+                    number *= units_factor(units_str, path_units)
+                fields.setdefault(field, len(fields))
+                row[fields[field]] = number
+
+            paths.append(path)
+            rows.append(row)
+            units_strs.append(path_units if path_units is not None else '')
+
+        values = np.full((len(paths), len(fields)), np.nan)
+        present = np.zeros(values.shape, dtype=bool)
+        for i, row in enumerate(rows):
+            for j, number in row.items():
+                values[i, j] = number
+                present[i, j] = True
+        return cls(paths, list(fields), values, units_strs, units=units, present=present)
+
+    def column(self, field, units_strs=None):
+        """Values of a field for all features, converted to the given per-feature units, if any"""
+
+        values = self.values[:, self.fields.index(field)]
+        if units_strs is None:
+            return values.copy()
+        factors = [1.0 if from_units == to_units else units_factor(from_units, to_units)
+                   for from_units, to_units in zip(self.units_strs, units_strs)]
+        return values * np.array(factors)
+
+    def row_index(self, path):
+        """Row of the feature with the given path"""
+
+        if self._row_index is None:
+            self._row_index = {path: i for i, path in enumerate(self.paths)}
+        return self._row_index[tuple(path)]
+
+    def quantity(self, path, field):
+        """Value of a field of the feature with the given path, as a quantities' Quantity object"""
+
+        i = self.row_index(path)
+        units = self.units if self.units is not None else parse_units(self.units_strs[i])
+        return quantities.Quantity(self.values[i, self.fields.index(field)], units)
+
+    def matrix(self, field, features, units_strs=None, name=None):
+        """Values of a field as a FeatureMatrix (rows x features), for a table whose paths are
+        (row key, cell_part, feat_name), e.g. (cell_ID, cell_part, feat_name) for predictions.
+        Columns follow 'features', a list of (cell_part, feat_name) pairs (other features are left out;
+        those missing are NaN), and are converted to the per-feature units 'units_strs', if given"""
+
+        columns = {tuple(feature): j for j, feature in enumerate(features)}
+        cols = np.array([columns.get(path[1:], -1) for path in self.paths], dtype=int).reshape(-1)
+        table_rows = np.flatnonzero(cols >= 0)
+        cols = cols[table_rows]
+        row_heads = [self.paths[k][0] for k in table_rows]
+        row_keys = {key: i for i, key in enumerate(dict.fromkeys(row_heads))}
+        rows = np.array([row_keys[key] for key in row_heads], dtype=int).reshape(-1)
+
+        numbers = self.values[table_rows, self.fields.index(field)]
+        if units_strs is not None:
+            from_units = np.array(self.units_strs, dtype=object)[table_rows]
+            to_units = np.array(units_strs, dtype=object)[cols]
+            convert = np.flatnonzero(from_units != to_units)
+            numbers[convert] *= [units_factor(from_units[k], to_units[k]) for k in convert]
+        values = np.full((len(row_keys), len(columns)), np.nan)
+        values[rows, cols] = numbers
+        return FeatureMatrix(values, list(row_keys), [cell_part for cell_part, _ in columns],
+                             [feat_name for _, feat_name in columns], name=name)
+
+    def to_tree(self):
+        """Returns the data tree, with the values as quantities' Quantity objects"""
+
+        data = dict()
+        for path, units_str, row, present in zip(self.paths, self.units_strs, self.values.tolist(), self.present):
+            units = self.units if self.units is not None else parse_units(units_str)
+            node = data
+            for key in path:
+                node = node.setdefault(key, dict())
+            for field, number, is_present in zip(self.fields, row, present):
+                if is_present:
+                    node[field] = quantities.Quantity(number, units)
+        return data
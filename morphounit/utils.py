@@ -5,7 +5,17 @@ import copy
 import neurom as nm
 import numpy as np
 
-from datetime import datetime
+from morphounit.artifacts import run_dir_name
+from morphounit.cache import FeatureCache, FileManifest
+from morphounit.population import PopulationAccumulator
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+from neurom.apps.morph_stats import extract_stats, sanitize_config
+from scipy.spatial import ConvexHull
+try:
+    from scipy.spatial import QhullError
+except ImportError:
+    from scipy.spatial.qhull import QhullError
 
 class neuroM_loader(sciunit.Model):
     def __init__(self, name="neuroM_loader", description="", model_path=None):
@@ -26,7 +36,8 @@ class NeuroM_MorphStats(sciunit.Model):
     """A class to interact with morphology files via the morphometrics-NeuroM's API (morph_stats)"""
 
     def __init__(self, model_name='NeuroM_MorphStats', morph_path=None, \
-                neuroM_pred_file=None, base_directory='.'):
+                neuroM_pred_file=None, base_directory='.', n_workers=1,
+                cache_dir=None, cache_max_size=2**30):
 
         sciunit.Model.__init__(self, name=model_name)
         self.description = "A class to interact with morphology files " \
@@ -36,15 +47,25 @@ class NeuroM_MorphStats(sciunit.Model):
         # Setting the morphology file to be processed by means of morph_stats
         self.morph_path = morph_path
 
+        # Number of worker processes among which the morphology files are shared,
+        # when 'morph_path' is a directory (None: as many as CPUs available)
+        self.n_workers = n_workers if n_workers else os.cpu_count()
+
+        # Persistent cache of the features extracted for each morphology file, if requested
+        self.cache = FeatureCache(cache_dir, max_size=cache_max_size) if cache_dir else None
+
         # Defining output dir and files
         self.morph_stats_output = os.path.join(base_directory, 'validation_results', 'neuroM_morph_softChecks',
-                                               self.model_version, datetime.now().strftime("%Y%m%d-%H%M%S"))
+                                               self.model_version, run_dir_name())
         self.output_pred_file = os.path.join(self.morph_stats_output, neuroM_pred_file)
 
     # ----------------------------------------------------------------------
 
-    def set_morph_feature_info(self, morph_stats_config_path=None):
+    def set_morph_feature_info(self, morph_stats_config_path=None, morph_stats_config=None):
         """
+        Computes the morph_stats features specified by a configuration dictionary
+        ('morph_stats_config') or, if not given, by a configuration file in JSON format
+        ('morph_stats_config_path').
         Must return a dictionary of the form:
         {"cell1_ID": { 'cell_part_1': {'morph_feature_name_11': X11},
                                        'morph_feature_name_12': X12},
@@ -63,77 +84,17 @@ class NeuroM_MorphStats(sciunit.Model):
         ... }
         """
 
-        # create output directory
-        if not os.path.exists(self.morph_stats_output):
-            os.makedirs(self.morph_stats_output)
-
-        try:
-            os.system(f"morph_stats -C {morph_stats_config_path} -o {self.output_pred_file} {self.morph_path}")
-        except IOError:
-            print("Please specify the path to the morphology directory and configuration file for morph_stats")
-
-        with open(self.output_pred_file, 'r') as fp:
-            mod_prediction = json.load(fp)
-
-        for key0, dict0 in list(mod_prediction.items()):  # Dict. with cell's morph_path-features dict. pairs for each cell
-            # Correcting cell's ID, given by some NeuroM versions:
-            # omitting enclosing directory's name
-            cell_ID = (key0.split("/")[-1])
-            del mod_prediction[key0]
-            mod_prediction.update({cell_ID: dict0})
-
-            # Additional formatting for neurom.fst.NEURONFEATURES.keys(), when present.
-            # Regrouping all neuron features-values pairs into a unique key ('neuron'),
-            # as in NeuroM's nomenclature, e.g. total_soma_radii, mean_trunk_section_lengths
-            neuron_feat_name_stat_mode = dict()
-            for key, val in list(dict0.items()):
-                if not any(sub_str in key for sub_str in ['dendrite', 'axon']):
-                    neuron_feat_name_stat_mode.update({key: val})
-                    del dict0[key]
-            if neuron_feat_name_stat_mode:
-                dict0.update({"neuron": neuron_feat_name_stat_mode})
-
-        # Additional formatting to morph_stats output:
-        # reversing some changes introduced into original NeuroM ('fst' module) nomenclature,
-        # e.g., number in feature names is changed from plural to singular, and sometimes 'radii' to 'radius'
-        # The configuration file for morph_stats is taken as the reference, to re-format the output file
-        # (instead of taking the observation file as reference, to keep independence between Model and Test classes)
-        with open(morph_stats_config_path, 'r') as fp:
-            morph_stats_config_dict = json.load(fp)
-        # print('morph_stats_config_dict = ', json.dumps(morph_stats_config_dict, sort_keys=True, indent=3))
-
-        neurite_feats_plural = list()
-        neuron_feats_plural = list()
-        for key0, dict0 in list(morph_stats_config_dict.items()):
-            if key0 == 'neurite':
-                neurite_feats_plural = [key1 for key1 in dict0.keys() if key1[-1] == 's']
-            elif key0 == 'neuron':
-                neuron_feats_plural = [key1 for key1 in dict0.keys() if key1[-1] == 's']
-
-        for cell_ID, dict0 in list(mod_prediction.items()):  # Dict. with cell's morph_path-features dict. pairs
-                                                            # for each cell
-            for cell_part, dict1 in list(dict0.items()):
-                for feat_name_stat_mode, value in list(dict1.items()):
-
-                    new_key = ''
-                    if 'radii' in feat_name_stat_mode:
-                        continue
-                    # Replacing "radius" by "radii", as in original NeuroM's nomenclature
-                    elif 'radius' in feat_name_stat_mode:
-                        new_key = feat_name_stat_mode.replace("radius", "radii")
-                    # Recovering the plural, as in original NeuroM's nomenclature
-                    elif cell_part == 'neuron':
-                        if neuron_feats_plural and any(feat_name_plural[:-1] in feat_name_stat_mode
-                                                       for feat_name_plural in neuron_feats_plural):
-                            new_key = feat_name_stat_mode + 's'
-                    elif neurite_feats_plural and any(feat_name_plural[:-1] in feat_name_stat_mode
-                                                      for feat_name_plural in neurite_feats_plural):
-                            new_key = feat_name_stat_mode + 's'
-
-                    if new_key:
-                        # print('Changing %s -> %s = \n' % (feat_name_stat_mode, new_key))
-                        del dict1[feat_name_stat_mode]
-                        dict1.update({new_key: value})
+        morph_stats_config_dict = morph_stats_config
+        if morph_stats_config_dict is None:
+            try:
+                with open(morph_stats_config_path, 'r') as fp:
+                    morph_stats_config_dict = json.load(fp)
+            except (IOError, TypeError):
+                raise ValueError("Please specify the path to the configuration file for morph_stats")
+
+        # Features are extracted in-process with NeuroM's morph_stats engine,
+        # one morphology file at a time (per worker process)
+        mod_prediction = self.map_morph_files(morph_stats_cell, morph_stats_config_dict)
 
         # Saving NeuroM's morph_stats output in a formatted json-file
         # with open(self.output_pred_file, 'w') as fp:
@@ -143,81 +104,95 @@ class NeuroM_MorphStats(sciunit.Model):
 
     # ----------------------------------------------------------------------
 
-    def complete_morph_feature_info(self, neuroM_extra_config_path=None):
+    def map_morph_files(self, cell_func, *args, morph_file_list=None):
+        """Applies 'cell_func(morph_file, *args)' to every morphology file in 'morph_path'
+        (or in 'morph_file_list', if given), merging the (cell_ID, cell_dict) pairs returned
+        into a single dictionary.
+        When more than one worker is requested, files are sharded across a pool of processes,
+        so 'cell_func' and its arguments must be picklable. The result is the same as in the serial case.
+        Results are looked up in (and added to) the model's cache, if any: the cache key depends
+        on the file contents, 'cell_func', its arguments and NeuroM's version."""
+
+        if morph_file_list is None:
+            morph_file_list = morph_files(self.morph_path)
+
+        return dict((cell_ID, cell_dict) for cell_ID, cell_dict in
+                    self._cells_feature_info(cell_func, morph_file_list, args))
+
+    def _cells_feature_info(self, cell_func, morph_file_list, args):
+        """Returns the list of (cell_ID, cell_dict) results for the files, in file order,
+        taking them from the cache whenever possible"""
+
+        if self.cache is None:
+            return self._map_cells(cell_func, morph_file_list, args)
+
+        # Only the cell_dict is cached: entries are shared by identical files, whatever their names,
+        # so the cell_ID is always taken from the file at hand
+        cache_keys = [self.cache.key(morph_file, 'cell_dict', cell_func.__name__, nm.__version__, *args)
+                      for morph_file in morph_file_list]
+        cells = [self.cache.get(cache_key) for cache_key in cache_keys]
+        cells = [None if cell_dict is None else (morph_file_cell_ID(morph_file), cell_dict)
+                 for morph_file, cell_dict in zip(morph_file_list, cells)]
+
+        missing = [i for i, cell in enumerate(cells) if cell is None]
+        computed_cells = self._map_cells(cell_func, [morph_file_list[i] for i in missing], args)
+        for i, cell in zip(missing, computed_cells):
+            self.cache.put(cache_keys[i], cell[1])
+            cells[i] = cell
+
+        return cells
+
+    def _map_cells(self, cell_func, morph_file_list, args):
+        """Returns the list of 'cell_func(morph_file, *args)' results, in file order"""
+
+        n_workers = min(self.n_workers, len(morph_file_list))
+        if n_workers <= 1:
+            return [cell_func(morph_file, *args) for morph_file in morph_file_list]
+
+        chunksize = max(1, len(morph_file_list) // (4 * n_workers))
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            return list(executor.map(cell_func, morph_file_list, *[repeat(arg) for arg in args],
+                                     chunksize=chunksize))
+
+    # ----------------------------------------------------------------------
+
+    def complete_morph_feature_info(self, neuroM_extra_config_path=None, mod_prediction=None,
+                                    neuroM_extra_config=None):
         """Adding more features by means of other NeuroM's functionalities
         to the prediction generated by function 'set_morph_feature_info',
         which uses just NeuroM's API for morph_stats
         Example of features added: field diameter, bounding-box -X,Y,Z- extents
-        and -largest,shortest- principal extents"""
-
-        extra_file_exists = os.path.isfile(neuroM_extra_config_path)
-        if not extra_file_exists:
-            return
-        with open(neuroM_extra_config_path, 'r') as fp:
-            morph_extra_dict = json.load(fp)
+        and -largest,shortest- principal extents
+        The prediction ('mod_prediction') and the features requested for each neurite type
+        ('neuroM_extra_config') can be passed as dictionaries; otherwise, they are read from
+        the model's prediction file and the configuration file 'neuroM_extra_config_path'"""
+
+        if mod_prediction is None:
+            with open(self.output_pred_file, 'r') as fp:
+                mod_prediction = json.load(fp)
+
+        morph_extra_dict = neuroM_extra_config
+        if morph_extra_dict is None and neuroM_extra_config_path and os.path.isfile(neuroM_extra_config_path):
+            with open(neuroM_extra_config_path, 'r') as fp:
+                morph_extra_dict = json.load(fp)
+        if not morph_extra_dict:
+            return mod_prediction
 
         # Adding more neurite's features, if requested:
         # field diameter, bounding-box -X,Y,Z- extents and -largest,shortest- principal extents
-        with open(self.output_pred_file, 'r') as fp:
-            mod_prediction = json.load(fp)
-
-        if os.path.isdir(self.morph_path):
-            morph_files = nm.io.utils.get_morph_files(self.morph_path)
-
-        mapping = lambda section: section.points
-        for neurite_name, extra_feat_list in list(morph_extra_dict.items()): # Dict. with neurite names and
-                                                                        # extra features to be computed
-            for cell_ID, dict0 in list(mod_prediction.items()):  # Dict. with cell's morph_path-features dict. pairs
-                                                            # for each cell
-
-                if os.path.isdir(self.morph_path):
-                    morph_file_name = [morph_file for morph_file in morph_files if cell_ID in morph_file]
-                    neuron_path = os.path.join(self.morph_path, os.path.basename(morph_file_name[0]))
-                else:
-                    neuron_path = self.morph_path
-
-                neuron_model = nm.load_neuron(neuron_path)
-
-                for cell_part, dict1 in list(dict0.items()):
-                    if cell_part == neurite_name:
-                        neurite_filter = lambda neurite: neurite.type == getattr(nm.NeuriteType, cell_part)
-                        neurite_points = [neurite_points for neurite_points in
-                                          nm.iter_neurites(neuron_model, mapping, neurite_filter)]
-                        neurite_points = np.concatenate(neurite_points)
-                        neurite_cloud = neurite_points[:, 0:3]
-
-                        for feat_name in extra_feat_list:
-                            # Compute the neurite's bounding-box -X,Y,Z- extents
-                            if feat_name=='neurite_X_extent':
-                                neurite_X_extent = np.max(neurite_cloud[:, 0], axis=0) - \
-                                                   np.min(neurite_cloud[:, 0], axis=0)
-                                dict1.update({"neurite_X_extent": neurite_X_extent})
-
-                            elif feat_name=='neurite_Y_extent':
-                                neurite_Y_extent = np.max(neurite_cloud[:, 1], axis=0) - \
-                                                   np.min(neurite_cloud[:, 1], axis=0)
-                                dict1.update({"neurite_Y_extent": neurite_Y_extent})
-
-                            elif feat_name=='neurite_Z_extent':
-                                neurite_Z_extent = np.max(neurite_cloud[:, 2], axis=0) - \
-                                                   np.min(neurite_cloud[:, 2], axis=0)
-                                dict1.update({"neurite_Z_extent": neurite_Z_extent})
-
-                            # Compute the neurite's principal extents
-                            elif feat_name=='neurite_shortest_extent':
-                                # Compute the neurite's shortest principal extents
-                                principal_extents = sorted(nm.morphmath.principal_direction_extent(neurite_cloud))
-                                dict1.update({"neurite_shortest_extent": principal_extents[0]})
-
-                            elif feat_name=='neurite_largest_extent':
-                                # Compute the neurite's largest principal extents
-                                principal_extents = sorted(nm.morphmath.principal_direction_extent(neurite_cloud))
-                                dict1.update({"neurite_largest_extent": principal_extents[-1]})
-
-                            # Compute the neurite-field diameter
-                            elif feat_name=='neurite_field_diameter':
-                                neurite_field_diameter = nm.morphmath.polygon_diameter(neurite_cloud)
-                                dict1.update({"neurite_field_diameter": neurite_field_diameter})
+        # Index of morphology files by cell_ID, built once
+        morph_file_index = {morph_file_cell_ID(morph_file): morph_file for morph_file in morph_files(self.morph_path)}
+        morph_file_list = [morph_file_index[cell_ID] for cell_ID in mod_prediction]
+
+        # Each morphology is loaded just once, to compute the extra features for all neurite types
+        extra_prediction = self.map_morph_files(extra_features_cell, morph_extra_dict,
+                                                morph_file_list=morph_file_list)
+
+        for cell_ID, dict0 in mod_prediction.items():  # Dict. with cell's morph_path-features dict. pairs
+                                                        # for each cell
+            for cell_part, extra_dict in extra_prediction[cell_ID].items():
+                if cell_part in dict0:
+                    dict0[cell_part].update(extra_dict)
 
         # Saving NeuroM's output in a formatted json-file
         # with open(self.output_pred_file, 'w') as fp:
@@ -258,32 +233,69 @@ class NeuroM_MorphStats(sciunit.Model):
 class NeuroM_MorphStats_pop(NeuroM_MorphStats):
     """A class to interact with a population of morphologies via the morphometrics-NeuroM's API (morph_stats)"""
     def __init__(self, model_name='NeuroM_MorphStats_pop', morph_path=None, \
-                neuroM_pred_file=None, base_directory='.'):
+                neuroM_pred_file=None, base_directory='.', n_workers=1,
+                cache_dir=None, cache_max_size=2**30, incremental=False, manifest_path=None,
+                keep_raw=True):
 
         super().__init__(model_name=model_name, morph_path=morph_path, \
                         neuroM_pred_file=neuroM_pred_file, \
-                        base_directory=base_directory)
+                        base_directory=base_directory, n_workers=n_workers, \
+                        cache_dir=cache_dir, cache_max_size=cache_max_size)
         self.description = "A class to interact with a population of morphologies \
                             via the morphometrics-NeuroM's API (morph_stats)"
 
+        # Incremental mode: only morphologies added or changed since the previous run are processed
+        # (the manifest of the previous run is kept next to the model's outputs, unless specified)
+        if incremental and not manifest_path:
+            manifest_path = os.path.join(os.path.dirname(self.morph_stats_output), 'manifest.json')
+        self.manifest = FileManifest(manifest_path) if manifest_path else None
+
+        # Whether the per-cell values are kept, besides the population's statistics (e.g. for plotting)
+        self.keep_raw = keep_raw
+        self.population_summary = None
+
     # ----------------------------------------------------------------------
 
-    def avg_prediction(self, mod_data=None):
-        """ Collecting raw data from all cells and computing the corresponding average"""
+    def _cells_feature_info(self, cell_func, morph_file_list, args):
+        """Returns the list of (cell_ID, cell_dict) results for the files, in file order,
+        reusing those of the previous run for the files whose contents did not change"""
 
-        mod_prediction = mod_data
+        if self.manifest is None:
+            return super()._cells_feature_info(cell_func, morph_file_list, args)
+
+        step_name = cell_func.__name__
+        step_key = FileManifest.step_key(nm.__version__, *args)
+        cells = [self.manifest.get(morph_file, step_name, step_key) for morph_file in morph_file_list]
+
+        missing = [i for i, cell in enumerate(cells) if cell is None]
+        computed_cells = super()._cells_feature_info(cell_func, [morph_file_list[i] for i in missing], args)
+        for i, cell in zip(missing, computed_cells):
+            self.manifest.put(morph_file_list[i], step_name, step_key, cell)
+            cells[i] = cell
+
+        self.manifest.save()
+        return cells
+
+    # ----------------------------------------------------------------------
 
-        population_features = copy.deepcopy(list(mod_prediction.values()))[0]
-        population_features_raw = dict.fromkeys(population_features, {})
-        for cell_part, feature_dict in list(population_features.items()):
-            feat_dict_raw = {feat_name: [cell_dict[cell_part][feat_name] for cell_dict in mod_prediction.values()]
-                             for feat_name in feature_dict.keys()}
-            population_features_raw.update({cell_part: feat_dict_raw})
-            feature_dict.update({feat_name: np.mean(feat_dict_raw[feat_name])
-                                 for feat_name in feature_dict.keys()})
+    def avg_prediction(self, mod_data=None, keep_raw=None):
+        """ Collecting raw data from all cells and computing the corresponding average.
+        'mod_data' is either a dictionary {cell_ID: cell_dict}, or an iterable (e.g. a generator)
+        of (cell_ID, cell_dict) pairs, which is consumed one cell at a time.
+        The population's raw data is returned as a FeatureMatrix (cells x features), only if 'keep_raw'
+        (by default, the model's setting); otherwise None is returned in its place"""
 
-        pop_avg_prediction = dict(FSI_mean=population_features)
-        pop_cells_prediction = dict(FSI_pop=population_features_raw)
+        cells = mod_data.items() if isinstance(mod_data, dict) else mod_data
+        if keep_raw is None:
+            keep_raw = self.keep_raw
+
+        accumulator = PopulationAccumulator(keep_raw=keep_raw).extend(cells)
+
+        # Running statistics (n, mean, var, std, min, max) of each feature across the population
+        self.population_summary = accumulator.summary()
+
+        pop_avg_prediction = dict(FSI_mean=accumulator.mean())
+        pop_cells_prediction = accumulator.raw_matrix(name='FSI_pop')
 
         # print 'pop_avg_prediction = ', json.dumps(pop_avg_prediction, sort_keys=True, indent=3), '\n\n'
         # print 'pop_cells_prediction = ', json.dumps(pop_cells_prediction, sort_keys=True, indent=3), '\n'
@@ -293,3 +305,202 @@ class NeuroM_MorphStats_pop(NeuroM_MorphStats):
         #    json.dump(pop_avg_prediction, fp, sort_keys=True, indent=3)
 
         return pop_cells_prediction, pop_avg_prediction
+
+
+# ----------------------------------------------------------------------
+
+
+def morph_files(morph_path):
+    """Returns the list of morphology files to be processed,
+    given the path to a single morphology file or to a directory of morphologies"""
+
+    if os.path.isdir(morph_path):
+        return nm.io.utils.get_morph_files(morph_path)
+    return [morph_path]
+
+
+def morph_file_cell_ID(morph_file):
+    """Returns the cell_ID of a morphology file: its name, without the extension
+    (as given by NeuroM, omitting the enclosing directory's name)"""
+
+    return os.path.splitext(os.path.basename(morph_file))[0]
+
+
+def _to_builtin(value):
+    """Converts NumPy scalars and arrays into Python objects,
+    as the JSON output of the morph_stats command-line tool used to do"""
+
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return value
+
+
+def morph_stats_cell(morph_file, morph_stats_config_dict):
+    """In-process replacement for running NeuroM's morph_stats on a single morphology file.
+    Returns the pair (cell_ID, {'cell_part_1': {'morph_feature_name_11': X11, ...}, ...}),
+    following the original NeuroM's ('fst' module) nomenclature"""
+
+    neuron_model = nm.load_neuron(morph_file)
+    # Correcting cell's ID, given by some NeuroM versions:
+    # omitting enclosing directory's name
+    cell_ID = neuron_model.name.split("/")[-1]
+
+    morph_stats_config = sanitize_config(copy.deepcopy(morph_stats_config_dict))
+    cell_stats = extract_stats(neuron_model, morph_stats_config)
+
+    # Regrouping all neuron features-values pairs into a unique key ('neuron'),
+    # as in NeuroM's nomenclature, e.g. total_soma_radii, mean_trunk_section_lengths
+    cell_dict = dict()
+    neuron_feat_name_stat_mode = dict()
+    for key, val in cell_stats.items():
+        if isinstance(val, dict):
+            val = {feat_name: _to_builtin(feat_val) for feat_name, feat_val in val.items()}
+        else:
+            val = _to_builtin(val)
+        if not any(sub_str in key for sub_str in ['dendrite', 'axon']):
+            neuron_feat_name_stat_mode.update({key: val})
+        else:
+            cell_dict.update({key: val})
+    if neuron_feat_name_stat_mode:
+        cell_dict.update({"neuron": neuron_feat_name_stat_mode})
+
+    # Reversing some changes introduced by morph_stats into original NeuroM ('fst' module) nomenclature,
+    # e.g., number in feature names is changed from plural to singular, and sometimes 'radii' to 'radius'
+    # The configuration for morph_stats is taken as the reference, to re-format its output
+    # (instead of taking the observation file as reference, to keep independence between Model and Test classes)
+    neurite_feats_plural = [key1 for key1 in morph_stats_config_dict.get('neurite', {}).keys() if key1[-1] == 's']
+    neuron_feats_plural = [key1 for key1 in morph_stats_config_dict.get('neuron', {}).keys() if key1[-1] == 's']
+
+    for cell_part, dict1 in list(cell_dict.items()):
+        for feat_name_stat_mode, value in list(dict1.items()):
+
+            new_key = ''
+            if 'radii' in feat_name_stat_mode:
+                continue
+            # Replacing "radius" by "radii", as in original NeuroM's nomenclature
+            elif 'radius' in feat_name_stat_mode:
+                new_key = feat_name_stat_mode.replace("radius", "radii")
+            # Recovering the plural, as in original NeuroM's nomenclature
+            elif cell_part == 'neuron':
+                if neuron_feats_plural and any(feat_name_plural[:-1] in feat_name_stat_mode
+                                               for feat_name_plural in neuron_feats_plural):
+                    new_key = feat_name_stat_mode + 's'
+            elif neurite_feats_plural and any(feat_name_plural[:-1] in feat_name_stat_mode
+                                              for feat_name_plural in neurite_feats_plural):
+                    new_key = feat_name_stat_mode + 's'
+
+            if new_key:
+                del dict1[feat_name_stat_mode]
+                dict1.update({new_key: value})
+
+    return cell_ID, cell_dict
+
+
+# Extra neurite features given by the bounding-box -X,Y,Z- extents
+_BBOX_EXTENT_FEATS = ('neurite_X_extent', 'neurite_Y_extent', 'neurite_Z_extent')
+
+
+def extra_features_cell(morph_file, morph_extra_dict):
+    """Computes the extra (non-morph_stats) neurite features requested in 'morph_extra_dict',
+    of the form {'neurite_name': ['extra_feat_name_1', ...], ...}, for all neurite types
+    from a single load of the morphology file.
+    Returns the pair (cell_ID, {'neurite_name': {'extra_feat_name_1': X1, ...}, ...})"""
+
+    neuron_model = nm.load_neuron(morph_file)
+    cell_ID = neuron_model.name.split("/")[-1]
+
+    # Point clouds of the neurite types requested, collected in a single pass over the neurites
+    neurite_points = {neurite_name: [] for neurite_name in morph_extra_dict}
+    for neurite in neuron_model.neurites:
+        if neurite.type.name in neurite_points:
+            neurite_points[neurite.type.name].append(neurite.points)
+    neurite_clouds = {neurite_name: np.concatenate(points_list)[:, 0:3]
+                      for neurite_name, points_list in neurite_points.items() if points_list}
+
+    return cell_ID, neurite_extra_features(morph_extra_dict, neurite_clouds)
+
+
+def neurite_extra_features(morph_extra_dict, neurite_clouds):
+    """Fused kernel for the extra neurite features: field diameter, bounding-box -X,Y,Z- extents
+    and -largest,shortest- principal extents. 'neurite_clouds' maps each neurite name to the (N, 3)
+    array of its points, which is reduced once per kind of feature; the PCA needed for the principal
+    extents is done once per neurite, batched over all the neurites of the cell.
+    Returns {'neurite_name': {'extra_feat_name_1': X1, ...}, ...}, with the features
+    requested in 'morph_extra_dict' ({'neurite_name': ['extra_feat_name_1', ...], ...})"""
+
+    neurite_names = [neurite_name for neurite_name in morph_extra_dict if neurite_name in neurite_clouds]
+
+    # Neurite's principal extents, from a single (batched) PCA
+    principal_names = [neurite_name for neurite_name in neurite_names
+                       if {'neurite_shortest_extent', 'neurite_largest_extent'} & set(morph_extra_dict[neurite_name])]
+    principal_extents = dict()
+    if principal_names:
+        centered_clouds = [neurite_clouds[neurite_name] - np.mean(neurite_clouds[neurite_name], axis=0)
+                           for neurite_name in principal_names]
+        _, eigv_stack = np.linalg.eig(np.array([np.cov(cloud.transpose()) for cloud in centered_clouds]))
+        for neurite_name, cloud, eigv in zip(principal_names, centered_clouds, eigv_stack):
+            principal_extents[neurite_name] = sorted(_principal_direction_extent(cloud, eigv))
+
+    extra_prediction = dict()
+    for neurite_name in neurite_names:
+        neurite_cloud = neurite_clouds[neurite_name]
+        extra_feat_list = morph_extra_dict[neurite_name]
+
+        dict1 = dict()
+        # Neurite's bounding-box -X,Y,Z- extents, from one min/max reduction over the three axes
+        if any(feat_name in extra_feat_list for feat_name in _BBOX_EXTENT_FEATS):
+            bbox_extents = np.max(neurite_cloud, axis=0) - np.min(neurite_cloud, axis=0)
+            for axis, feat_name in enumerate(_BBOX_EXTENT_FEATS):
+                if feat_name in extra_feat_list:
+                    dict1.update({feat_name: bbox_extents[axis]})
+
+        if 'neurite_shortest_extent' in extra_feat_list:
+            dict1.update({"neurite_shortest_extent": principal_extents[neurite_name][0]})
+        if 'neurite_largest_extent' in extra_feat_list:
+            dict1.update({"neurite_largest_extent": principal_extents[neurite_name][-1]})
+
+        # Neurite-field diameter
+        if 'neurite_field_diameter' in extra_feat_list:
+            dict1.update({"neurite_field_diameter": _polygon_diameter(neurite_cloud)})
+
+        extra_prediction.update({neurite_name: {feat_name: _to_builtin(value) for feat_name, value in dict1.items()}})
+
+    return extra_prediction
+
+
+def _principal_direction_extent(centered_cloud, eigv):
+    """Vectorized version of nm.morphmath.principal_direction_extent, given the (centered) points
+    and the eigenvectors of their covariance matrix. Negative projections are accumulated
+    exactly as NeuroM does, so that results are the same"""
+
+    projections = np.dot(centered_cloud, eigv)
+    proj_max, proj_min = np.max(projections, axis=0), np.min(projections, axis=0)
+
+    extent = np.zeros(eigv.shape[1])
+    for i in range(eigv.shape[1]):
+        extent[i] = proj_max[i]
+        if proj_min[i] < 0.:
+            extent -= proj_min[i]
+    return extent
+
+
+def _polygon_diameter(cloud):
+    """Vectorized version of nm.morphmath.polygon_diameter: maximum euclidean distance
+    between any two points of the cloud. The search is restricted to the vertices
+    of the cloud's convex hull, when it can be built, and done by blocks of points
+    to keep memory bounded"""
+
+    try:
+        cloud = cloud[ConvexHull(cloud).vertices]
+    except (QhullError, ValueError):
+        pass  # Degenerate (e.g. flat) clouds: every point is a candidate
+
+    block_size = max(1, 2 ** 22 // len(cloud))
+    max_sq_dist = 0.
+    for start in range(0, len(cloud), block_size):
+        block = cloud[start:start + block_size]
+        sq_dists = np.sum((block[:, np.newaxis, :] - cloud[np.newaxis, :, :]) ** 2, axis=-1)
+        max_sq_dist = max(max_sq_dist, np.max(sq_dists))
+    return np.sqrt(max_sq_dist)
@@ -20,7 +20,8 @@ setup(
     license='BSD 3-Clause',
     description='A SciUnit library for data-driven testing of neuronal morphologies.',
     long_description="",
-    install_requires=['neo', 'elephant','sciunit>=0.1.5.2', 'neurom==1.4.10', 'tabulate', 'seaborn==0.9.0'],
+    python_requires='>=3.7',  # Plugins are loaded lazily through module-level __getattr__ (PEP 562)
+    install_requires=['neo', 'elephant','sciunit>=0.1.5.2', 'neurom==1.4.10', 'scipy', 'tabulate', 'seaborn==0.9.0'],
     dependency_links = ['git+http://github.com/neuralensemble/python-neo.git#egg=neo-0.4.0dev',
                         'https://github.com/scidash/sciunit/tarball/dev']
 )
@@ -0,0 +1,59 @@
+import os
+import shutil
+
+import pytest
+
+import morphounit.utils as mu
+
+MORPH_STATS_CONFIG = {"neurite": {"section_lengths": ["total"], "number_of_sections": ["total"]},
+                      "neurite_type": ["AXON", "BASAL_DENDRITE"],
+                      "neuron": {"soma_radii": ["mean"]}}
+MORPH_EXTRA_CONFIG = {"axon": ["neurite_field_diameter", "neurite_X_extent"],
+                      "basal_dendrite": ["neurite_largest_extent"]}
+
+
+def write_swc(file_path, scale):
+    """Writes a small morphology (3-point soma, one axon and one basal dendrite with a bifurcation),
+    whose neurites' lengths are proportional to 'scale'"""
+
+    lines = ["1 1 0 0 0 5 -1", "2 1 0 -5 0 5 1", "3 1 0 5 0 5 1",
+             # Axon
+             "4 2 0 %g 0 1 1" % (-10 * scale), "5 2 0 %g 0 1 4" % (-20 * scale),
+             "6 2 %g %g 0 1 5" % (-5 * scale, -30 * scale), "7 2 %g %g 0 1 5" % (5 * scale, -35 * scale),
+             # Basal dendrite
+             "8 3 %g 0 0 1 1" % (10 * scale), "9 3 %g 0 0 1 8" % (20 * scale),
+             "10 3 %g %g 0 1 9" % (30 * scale, 5 * scale), "11 3 %g %g 0 1 9" % (30 * scale, -5 * scale)]
+    with open(file_path, 'w') as fp:
+        fp.write("\n".join(lines) + "\n")
+
+
+def run_model(morph_dir, cache_dir, base_directory, **kwargs):
+    model = mu.NeuroM_MorphStats_pop(morph_path=str(morph_dir), neuroM_pred_file='prediction.json',
+                                     base_directory=str(base_directory), cache_dir=str(cache_dir), **kwargs)
+    mod_prediction = model.map_morph_files(mu.morph_stats_cell, MORPH_STATS_CONFIG)
+    return model.complete_morph_feature_info(mod_prediction=mod_prediction, neuroM_extra_config=MORPH_EXTRA_CONFIG)
+
+
+@pytest.mark.parametrize("incremental", [False, True])
+def test_cache_keeps_cell_IDs_of_copied_and_renamed_files(tmp_path, incremental):
+    morph_dir = tmp_path / "morphs"
+    morph_dir.mkdir()
+    write_swc(morph_dir / "cell_a.swc", 1.0)
+    write_swc(morph_dir / "cell_b.swc", 2.0)
+    # Identical contents, hence the same cache entries as 'cell_a'
+    shutil.copyfile(morph_dir / "cell_a.swc", morph_dir / "cell_a_copy.swc")
+
+    cache_dir = tmp_path / "cache"
+    cold = run_model(morph_dir, cache_dir, tmp_path / "out", incremental=incremental)
+    assert sorted(cold) == ["cell_a", "cell_a_copy", "cell_b"]
+    assert cold["cell_a_copy"] == cold["cell_a"]
+
+    warm = run_model(morph_dir, cache_dir, tmp_path / "out", incremental=incremental)
+    assert warm == cold
+
+    # A renamed file is still found in the cache, but under its new cell_ID
+    os.rename(morph_dir / "cell_b.swc", morph_dir / "cell_c.swc")
+    renamed = run_model(morph_dir, cache_dir, tmp_path / "out", incremental=incremental)
+    assert sorted(renamed) == ["cell_a", "cell_a_copy", "cell_c"]
+    assert renamed["cell_c"] == cold["cell_b"]
+    assert renamed["cell_a"] == cold["cell_a"]